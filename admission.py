@@ -0,0 +1,158 @@
+"""
+Admission control in front of the chat start.
+
+When a survey sends more participants than the LLM proxy and the container can
+serve, every chat would slow down together. With ADMISSION_MAX_ACTIVE set, at
+most that many chats run at once per container. A participant arriving beyond
+that waits in a waiting room that polls every ADMISSION_POLL_SECONDS, sees a
+queue position and estimated wait, and is admitted first come, first served.
+
+The capacity shrinks while LLM calls are slow: if the moving average latency
+goes over ADMISSION_LATENCY_TARGET_SECONDS, capacity is scaled down by
+target / latency. New chats also wait while more than ADMISSION_MAX_LLM_INFLIGHT
+LLM calls are in flight (0 = no limit).
+
+A chat's slot is released when its Streamlit session disconnects or after
+ADMISSION_IDLE_SECONDS without activity. A released participant who comes back
+takes a slot again without waiting, since their chat has already started.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(f"chat_app.{__name__}")
+
+MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", "0") or 0)
+MAX_LLM_INFLIGHT = int(os.getenv("ADMISSION_MAX_LLM_INFLIGHT", "0") or 0)
+LATENCY_TARGET_SECONDS = float(os.getenv("ADMISSION_LATENCY_TARGET_SECONDS", "8"))
+IDLE_SECONDS = float(os.getenv("ADMISSION_IDLE_SECONDS", "600"))
+POLL_SECONDS = float(os.getenv("ADMISSION_POLL_SECONDS", "5"))
+# Waiting participants who stop polling for this long have left the queue
+WAITING_TIMEOUT_SECONDS = 4 * POLL_SECONDS
+# Assumed chat length until some chats have finished
+DEFAULT_CHAT_SECONDS = 600
+EWMA_WEIGHT = 0.2
+
+
+def _ewma(current, value):
+    return value if current is None else (1 - EWMA_WEIGHT) * current + EWMA_WEIGHT * value
+
+
+class _Slot:
+    __slots__ = ("admitted_at", "last_seen", "is_alive")
+
+    def __init__(self, now, is_alive):
+        self.admitted_at = now
+        self.last_seen = now
+        self.is_alive = is_alive
+
+
+class AdmissionController:
+    def __init__(self, max_active=MAX_ACTIVE, max_llm_inflight=MAX_LLM_INFLIGHT,
+                 latency_target=LATENCY_TARGET_SECONDS, idle_seconds=IDLE_SECONDS):
+        self.max_active = max_active
+        self.max_llm_inflight = max_llm_inflight
+        self.latency_target = latency_target
+        self.idle_seconds = idle_seconds
+        self._active = {}
+        self._waiting = OrderedDict()  # session id -> last poll
+        self._latency = None
+        self._chat_seconds = None
+        self._lock = threading.Lock()
+
+    def observe_latency(self, seconds):
+        """Feed the latency of a finished LLM call into the moving average."""
+        with self._lock:
+            self._latency = _ewma(self._latency, seconds)
+
+    def capacity(self):
+        """Chats allowed to run right now."""
+        latency = self._latency
+        if latency is None or latency <= self.latency_target:
+            return self.max_active
+        return max(1, int(self.max_active * self.latency_target / latency))
+
+    def _llm_saturated(self):
+        return self.max_llm_inflight > 0 and metrics.get("llm_calls_inflight") >= self.max_llm_inflight
+
+    def _release(self, session_id, now, reason):
+        slot = self._active.pop(session_id, None)
+        if slot is not None:
+            self._chat_seconds = _ewma(self._chat_seconds, now - slot.admitted_at)
+            metrics.incr(f"admission_released_{reason}")
+
+    def _sweep(self, now):
+        for session_id, slot in list(self._active.items()):
+            if now - slot.last_seen > self.idle_seconds:
+                self._release(session_id, now, "idle")
+            elif slot.is_alive is not None and not slot.is_alive():
+                self._release(session_id, now, "disconnected")
+        for session_id, last_poll in list(self._waiting.items()):
+            if now - last_poll > WAITING_TIMEOUT_SECONDS:
+                del self._waiting[session_id]
+                metrics.incr("admission_abandoned")
+
+    def try_admit(self, session_id, is_alive=None, now=None):
+        """
+        Admit the session if it is first in line and there is room. Returns
+        (admitted, position in line, estimated wait in seconds); position and
+        wait are 0 once admitted.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if session_id in self._active:
+                return True, 0, 0
+            self._sweep(now)
+            if session_id not in self._waiting:
+                metrics.incr("admission_arrivals")
+            self._waiting[session_id] = now
+            position = list(self._waiting).index(session_id) + 1
+            capacity = self.capacity()
+            if position == 1 and len(self._active) < capacity and not self._llm_saturated():
+                del self._waiting[session_id]
+                self._active[session_id] = _Slot(now, is_alive)
+                metrics.incr("admission_admitted")
+                return True, 0, 0
+            chat_seconds = self._chat_seconds or DEFAULT_CHAT_SECONDS
+            eta = position * chat_seconds / max(capacity, 1)
+            active, waiting = len(self._active), len(self._waiting)
+        if position == 1:
+            logger.info(f"Waiting room - active: {active}/{capacity}, waiting: {waiting}")
+        return False, position, eta
+
+    def touch(self, session_id, is_alive=None, now=None):
+        """Mark an admitted chat active, taking its slot back if it had been released."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            slot = self._active.get(session_id)
+            if slot is None:
+                self._active[session_id] = _Slot(now, is_alive)
+                metrics.incr("admission_readmitted")
+            else:
+                slot.last_seen = now
+
+    def release(self, session_id):
+        with self._lock:
+            self._release(session_id, time.monotonic(), "ended")
+            self._waiting.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": len(self._active),
+                "waiting": len(self._waiting),
+                "capacity": self.capacity(),
+                "latency_ewma": self._latency,
+            }
+
+
+_controller = AdmissionController()
+
+
+def get_admission_controller():
+    """The process-wide controller, or None when ADMISSION_MAX_ACTIVE is not set."""
+    return _controller if MAX_ACTIVE > 0 else None
@@ -0,0 +1,142 @@
+"""
+Balanced condition assignment for participants whose URL has no condition.
+
+Participants are allocated in blocks: every run of len(conditions) assignments
+covers each condition exactly once, in an order shuffled per block. The only
+shared write per new participant is one atomic counter increment in the state
+store, so concurrent assignments never queue behind a lock. Each study keeps
+its own sequence and counters.
+
+Check balance under concurrent load with:
+
+    uv run python assignment.py stress [--participants 8000] [--workers 4] [--threads 32] [--backend sqlite]
+"""
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger(f"chat_app.{__name__}")
+
+CONDITIONS = ["DS", "DO", "RS", "RO"]
+
+
+def _prefix(study):
+    return "assignment" if study is None else f"assignment:{study}"
+
+
+def block_condition(sequence_number, seed=None, conditions=CONDITIONS):
+    """Return the condition for the n-th assignment (0-based) of the block schedule."""
+    seed = seed if seed is not None else os.getenv("ASSIGNMENT_SEED", "qualtrics-chat")
+    block, position = divmod(sequence_number, len(conditions))
+    # Seeding per block keeps the schedule identical on every worker
+    order = random.Random(f"{seed}:{block}").sample(list(conditions), len(conditions))
+    return order[position]
+
+
+def assign_condition(store, participant_key, conditions=CONDITIONS, study=None):
+    """
+    Return the participant's condition, allocating the next block slot on first use.
+
+    The assignment is pinned under participant_key, so reruns, reconnects and
+    other workers all see the same condition.
+    """
+    prefix = _prefix(study)
+    pinned_key = f"{prefix}:participant:{participant_key}"
+    existing = store.get(pinned_key)
+    if existing is not None:
+        return existing
+
+    sequence_number = store.incr(f"{prefix}:seq") - 1
+    condition = block_condition(sequence_number, conditions=conditions)
+    if store.set_if_absent(pinned_key, condition):
+        store.incr(f"{prefix}:count:{condition}")
+        logger.info(f"Assigned condition {condition} (slot {sequence_number})")
+        return condition
+
+    # Another session of the same participant won the race; its pick stands
+    logger.warning(f"Assignment slot {sequence_number} unused after concurrent assignment")
+    return store.get(pinned_key)
+
+
+def assignment_counts(store, conditions=CONDITIONS, study=None):
+    """Return {condition: participants assigned} for checking balance."""
+    prefix = _prefix(study)
+    return {condition: int(store.get(f"{prefix}:count:{condition}", 0)) for condition in conditions}
+
+
+def _stress_worker(db_path, keys, threads):
+    """Assign keys from one worker process; returns {key: condition}."""
+    from state_store import SQLiteStateStore
+
+    store = SQLiteStateStore(db_path)
+    with ThreadPoolExecutor(threads) as pool:
+        return dict(zip(keys, pool.map(lambda key: assign_condition(store, key, study="stress"), keys)))
+
+
+def stress(participants, workers, threads, backend, reloads):
+    """
+    Assign participants concurrently from several worker processes (sqlite) or
+    threads (local), with a reloads fraction requesting their condition a second
+    time at once, then check the block balance. Returns True if it holds.
+    """
+    from state_store import LocalStateStore, SQLiteStateStore
+
+    keys = [f"participant-{i}" for i in range(participants)]
+    requests = keys + random.Random(0).sample(keys, int(participants * reloads))
+    random.Random(1).shuffle(requests)
+    directory = tempfile.mkdtemp(prefix="assignment-stress-")
+    try:
+        results = []
+        started = time.perf_counter()
+        if backend == "sqlite":
+            db_path = os.path.join(directory, "state.sqlite3")
+            store = SQLiteStateStore(db_path)
+            with ProcessPoolExecutor(workers) as pool:
+                for result in pool.map(_stress_worker, [db_path] * workers, [requests[i::workers] for i in range(workers)], [threads] * workers):
+                    results.append(result)
+        else:
+            store = LocalStateStore(directory)
+            with ThreadPoolExecutor(threads) as pool:
+                results.append(dict(zip(requests, pool.map(lambda key: assign_condition(store, key, study="stress"), requests))))
+        elapsed = time.perf_counter() - started
+
+        counts = assignment_counts(store, study="stress")
+        slots = int(store.get(f"{_prefix('stress')}:seq", 0))
+        pinned = {key: store.get(f"{_prefix('stress')}:participant:{key}") for key in keys}
+    finally:
+        shutil.rmtree(directory)
+
+    inconsistent = sum(1 for result in results for key, condition in result.items() if condition != pinned[key])
+    unused_slots = slots - participants
+    spread = max(counts.values()) - min(counts.values())
+    print(f"{len(requests)} requests for {participants} participants in {elapsed:.2f}s ({len(requests) / elapsed:,.0f}/s), {backend} backend")
+    print("Per condition: " + ", ".join(f"{condition} {count}" for condition, count in counts.items()))
+    print(f"Spread {spread}, unused slots from concurrent reloads {unused_slots}, inconsistent answers {inconsistent}")
+    # A complete schedule is exactly balanced; each slot lost to a reload race can shift one count
+    return sum(counts.values()) == participants and inconsistent == 0 and spread <= 1 + unused_slots
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress test balanced condition assignment.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    stress_parser = subparsers.add_parser("stress", help="Assign participants concurrently and check the balance")
+    stress_parser.add_argument("--participants", type=int, default=8000)
+    stress_parser.add_argument("--workers", type=int, default=4, help="Worker processes sharing the SQLite store")
+    stress_parser.add_argument("--threads", type=int, default=32, help="Concurrent assignments per worker")
+    stress_parser.add_argument("--backend", choices=["sqlite", "local"], default="sqlite")
+    stress_parser.add_argument("--reloads", type=float, default=0.05, help="Fraction of participants requesting twice at once")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)  # unused-slot warnings are summarised below
+    if not stress(args.participants, args.workers, args.threads, args.backend, args.reloads):
+        print("Assignment is out of balance", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Shared worker pool for work that should not block a participant's script run,
+such as prefetching a bot reply.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from streamlit.runtime.scriptrunner_utils.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide pool, sized by BACKGROUND_WORKERS (default 16)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("BACKGROUND_WORKERS", "16")),
+                thread_name_prefix="chat-background",
+            )
+        return _executor
+
+
+def bind_script_run_ctx(fn):
+    """
+    Wrap fn so that, on whichever thread it is later called, the caller's script
+    run context is attached first. Log lines and st.session_state then still
+    refer to the participant's session. The thread's previous context is put
+    back afterwards, so a pooled thread does not keep the session alive or
+    lend it to the next task.
+    """
+    ctx = get_script_run_ctx()
+
+    def run(*args, **kwargs):
+        if ctx is None:
+            return fn(*args, **kwargs)
+        thread = threading.current_thread()
+        previous = getattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, None)
+        add_script_run_ctx(thread, ctx)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            # add_script_run_ctx cannot set None, so restore the attribute directly
+            if previous is None:
+                delattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME)
+            else:
+                setattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, previous)
+
+    return run
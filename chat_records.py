@@ -0,0 +1,68 @@
+"""
+Compact in-memory records for chat sessions.
+
+Every session keeps its transcript in st.session_state for its whole lifetime,
+so messages use slotted objects with interned speaker names instead of dicts,
+and bot personalities are shared objects referenced by every session rather
+than per-session copies of their long system prompts.
+"""
+import sys
+
+INVITATION_CODE_PLACEHOLDER = "{invitation_code}"
+
+
+class ChatMessage:
+    """One transcript entry: role is "system", "assistant" or "user"."""
+
+    __slots__ = ("role", "content", "name")
+
+    def __init__(self, role, content, name=None):
+        self.role = sys.intern(role)
+        self.content = content
+        self.name = sys.intern(name) if name else None
+
+    def to_api(self):
+        """The {"role", "content"} dict sent to the completion API."""
+        return {"role": self.role, "content": self.content}
+
+
+class BotPersonality:
+    """
+    A bot's display name, system prompt template and generation limit, shared
+    by all sessions.
+
+    The prompt mentions the participant's invitation code, so the template keeps
+    a placeholder that is filled in when a request is built.
+    """
+
+    __slots__ = ("name", "prompt_template", "max_tokens")
+
+    def __init__(self, name, prompt_template, max_tokens=None):
+        self.name = sys.intern(name)
+        self.prompt_template = prompt_template
+        self.max_tokens = max_tokens
+
+    def system_message(self, invitation_code):
+        return {
+            "role": "system",
+            "content": self.prompt_template.replace(INVITATION_CODE_PLACEHOLDER, invitation_code)
+        }
+
+
+def messages_from_rows(rows):
+    """
+    Rebuild a transcript from stored conversation rows (dicts with "content" and
+    "chatbot_type"), undoing the "Name: " prefix save_conversation adds.
+    """
+    messages = []
+    for row in rows:
+        speaker, sep, text = row["content"].partition(": ")
+        if not sep:
+            speaker, text = None, row["content"]
+        if row["chatbot_type"] == "System_Instruction":
+            messages.append(ChatMessage("system", text, "Instructions"))
+        elif row["chatbot_type"] == "user_message":
+            messages.append(ChatMessage("user", text, speaker))
+        else:
+            messages.append(ChatMessage("assistant", text, row["chatbot_type"]))
+    return messages
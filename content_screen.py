@@ -0,0 +1,107 @@
+"""
+Local pre-screen for prompts the proxy's content filter is likely to reject.
+
+The company proxy rejects some prompts with a ContentPolicyViolationError,
+which costs a round trip before the fallback model is tried. Participants'
+latest message is screened here first, and when the study has a separate
+fallback_model, a flagged turn goes to it straight away (see
+llm_client.submit).
+
+Two stages, both local:
+
+- One compiled regex over built-in threat, incitement and self-harm phrases, plus
+  any patterns (one regex per line, # for comments) in the file named by
+  CONTENT_SCREEN_PATTERNS_FILE.
+- Optionally, a small offline classifier: a scikit-learn text pipeline saved
+  with joblib at CONTENT_SCREEN_MODEL, flagging messages whose predict_proba
+  score for the flagged class is at least CONTENT_SCREEN_THRESHOLD (default
+  0.5). scikit-learn and joblib are only imported when the model is configured.
+
+Only the latest participant ("user") message is screened, so one flagged turn
+does not send the rest of the conversation to the fallback model; if the
+history alone gets a later call rejected, that call falls back without
+retries. Results are cached per message text. Set CONTENT_SCREEN=0 to turn the
+pre-screen off.
+"""
+import functools
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(f"chat_app.{__name__}")
+
+ENABLED = os.getenv("CONTENT_SCREEN", "1") == "1"
+PATTERNS_FILE = os.getenv("CONTENT_SCREEN_PATTERNS_FILE", "")
+MODEL_PATH = os.getenv("CONTENT_SCREEN_MODEL", "")
+THRESHOLD = float(os.getenv("CONTENT_SCREEN_THRESHOLD", "0.5"))
+
+# Threats, incitement and self-harm the proxy's filters commonly reject. Words
+# that also describe the war (genocide, terrorist, massacre, murdered, suicide
+# drones) are left out on purpose: in a political study they are ordinary speech.
+DEFAULT_PATTERNS = [
+    r"(?:kill|shoot|bomb|nuke|hang|behead|exterminate)\s+(?:them|him|her|you|all\s+of\s+them|every\s+last\s+one)",
+    r"(?:i'?ll|i\s+will|gonna|going\s+to)\s+(?:kill|hurt|shoot|find)\s+you",
+    r"(?:should|deserve\s+to|hope\s+(?:they|he|she|you))\s+die",
+    r"kill\s+(?:myself|yourself)",
+    r"commit(?:ting)?\s+suicide",
+    r"suicidal",
+]
+
+_classifier = None
+_classifier_loaded = False
+_classifier_lock = threading.Lock()
+
+
+def _load_patterns():
+    patterns = list(DEFAULT_PATTERNS)
+    if PATTERNS_FILE:
+        with open(PATTERNS_FILE, encoding="utf-8") as f:
+            patterns += [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    return re.compile(r"\b(?:" + "|".join(f"(?:{p})" for p in patterns) + r")\b", re.IGNORECASE)
+
+
+_pattern = _load_patterns()
+
+
+def get_classifier():
+    """The optional classifier, loaded on first use; None when not configured or it failed to load."""
+    global _classifier, _classifier_loaded
+    if not MODEL_PATH:
+        return None
+    with _classifier_lock:
+        if not _classifier_loaded:
+            _classifier_loaded = True
+            try:
+                import joblib
+
+                _classifier = joblib.load(MODEL_PATH)
+                logger.info(f"Loaded content screen classifier from {MODEL_PATH}")
+            except Exception:
+                logger.exception(f"Could not load content screen classifier {MODEL_PATH} - using patterns only")
+        return _classifier
+
+
+@functools.lru_cache(maxsize=4096)
+def screen_text(text):
+    """Why text is likely to be rejected ("pattern: ..." or "classifier: ..."), or None."""
+    match = _pattern.search(text)
+    if match:
+        return f"pattern: {match.group(0)}"
+    classifier = get_classifier()
+    if classifier is not None:
+        score = float(classifier.predict_proba([text])[0][-1])
+        if score >= THRESHOLD:
+            return f"classifier: {score:.2f}"
+    return None
+
+
+def screen_messages(messages):
+    """Screen the latest participant message of a completion request. Returns the reason it was flagged, or None."""
+    if not ENABLED:
+        return None
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = message.get("content")
+            return screen_text(content) if isinstance(content, str) else None
+    return None
@@ -0,0 +1,193 @@
+"""
+Lock-free append-only conversation logs.
+
+With CONVERSATION_LOG_FORMAT=jsonl the local store writes each message as one
+JSON line to conversation_{userID}_{invitation_code}.jsonl instead of a CSV row.
+Every record is a single os.write() to a file opened with O_APPEND, so
+concurrent writers never interleave and no .lock file or FileLock is needed.
+POSIX only promises this for writes up to PIPE_BUF bytes; longer records rely on
+the local filesystem serializing appends (ext4, xfs and overlayfs do) and are
+counted in metrics as conversation_log_large_records.
+
+CONVERSATION_LOG_FSYNC controls durability: unset flushes like the CSV writer
+(left to the OS), "always" fsyncs every record, and a number of seconds
+fsyncs the files written since the last pass on a background thread.
+
+Convert logs to the usual CSV schema, or compare the two write paths, with:
+
+    uv run python conversation_log.py compact [--conversations-dir conversations]
+    uv run python conversation_log.py bench [--rows 2000] [--threads 8]
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import select
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+logger = logging.getLogger(f"chat_app.{__name__}")
+
+LOG_SUFFIX = ".jsonl"
+PIPE_BUF = getattr(select, "PIPE_BUF", 512)
+
+
+def log_filename(csv_filename):
+    """conversation_x_y.csv -> conversation_x_y.jsonl"""
+    return os.path.splitext(csv_filename)[0] + LOG_SUFFIX
+
+
+def encode_record(row, fieldnames):
+    return (json.dumps({name: row.get(name, "") for name in fieldnames}, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class AppendLog:
+    """
+    Appends JSON records to files with one O_APPEND write each.
+
+    fsync is None (never), 0 (every record) or the seconds between background
+    fsync passes over the files written since the previous pass.
+    """
+
+    def __init__(self, fieldnames, fsync=None):
+        self.fieldnames = fieldnames
+        self.fsync = fsync
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        if fsync:
+            threading.Thread(target=self._fsync_loop, name="conversation-log-fsync", daemon=True).start()
+
+    def append(self, path, row):
+        data = encode_record(row, self.fieldnames)
+        if len(data) > PIPE_BUF:
+            metrics.incr("conversation_log_large_records")
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            if self.fsync == 0:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        if self.fsync:
+            with self._dirty_lock:
+                self._dirty.add(path)
+
+    def flush(self):
+        """fsync every file written since the last pass."""
+        with self._dirty_lock:
+            paths, self._dirty = self._dirty, set()
+        for path in paths:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError:
+                logger.exception(f"Failed to fsync {path}")
+
+    def _fsync_loop(self):
+        while True:
+            time.sleep(self.fsync)
+            self.flush()
+
+
+def fsync_setting(value=None):
+    """Parse CONVERSATION_LOG_FSYNC into the AppendLog fsync argument."""
+    value = (os.getenv("CONVERSATION_LOG_FSYNC", "") if value is None else value).strip().lower()
+    if not value:
+        return None
+    if value == "always":
+        return 0
+    return float(value)
+
+
+def read_rows(path, fieldnames):
+    """
+    Read a log into row dicts. A line that does not parse (e.g. cut short by a
+    crash mid-write) is skipped rather than failing the whole file.
+    """
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping unreadable line {number} in {path}")
+                continue
+            rows.append({name: record.get(name, "") for name in fieldnames})
+    return rows
+
+
+def compact_to_csv(log_path, fieldnames):
+    """Write the log's rows to the matching .csv file (replaced atomically). Returns the row count."""
+    rows = read_rows(log_path, fieldnames)
+    csv_path = os.path.splitext(log_path)[0] + ".csv"
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(log_path) or ".", suffix=".csv.tmp")
+    try:
+        with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(tmp_path, csv_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(rows)
+
+
+def benchmark(rows, threads):
+    """Time the FileLock CSV path against the append log, writing rows from several threads."""
+    from state_store import CONVERSATION_FIELDNAMES, LocalStateStore
+
+    row = {name: f"{name}-value" for name in CONVERSATION_FIELDNAMES}
+    row["content"] = "Bot: " + "this is a typical chat message " * 4
+    files = max(threads // 2, 1)  # a few conversations written concurrently
+    results = {}
+    for label, log_format in [("csv + FileLock", "csv"), ("jsonl O_APPEND", "jsonl")]:
+        directory = tempfile.mkdtemp(prefix="conversation-log-bench-")
+        try:
+            store = LocalStateStore(directory, conversation_format=log_format)
+            started = time.perf_counter()
+            with ThreadPoolExecutor(threads) as pool:
+                list(pool.map(lambda i: store.append_conversation_row(row, f"conversation_{i % files}_x.csv"), range(rows)))
+            elapsed = time.perf_counter() - started
+            results[label] = (elapsed, len(os.listdir(directory)))
+        finally:
+            shutil.rmtree(directory)
+    for label, (elapsed, entries) in results.items():
+        print(f"{label:16} {rows / elapsed:10.0f} rows/s  {elapsed * 1e6 / rows:8.1f} us/row  {entries} directory entries")
+
+
+def main():
+    from state_store import CONVERSATION_FIELDNAMES, CONVERSATIONS_DIR
+
+    parser = argparse.ArgumentParser(description="Compact or benchmark append-only conversation logs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compact = subparsers.add_parser("compact", help="Write each conversation_*.jsonl log as a CSV file")
+    compact.add_argument("--conversations-dir", default=CONVERSATIONS_DIR)
+    bench = subparsers.add_parser("bench", help="Compare the CSV and JSONL write paths")
+    bench.add_argument("--rows", type=int, default=2000)
+    bench.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        benchmark(args.rows, args.threads)
+        return
+    names = sorted(n for n in os.listdir(args.conversations_dir) if n.startswith("conversation_") and n.endswith(LOG_SUFFIX))
+    for name in names:
+        count = compact_to_csv(os.path.join(args.conversations_dir, name), CONVERSATION_FIELDNAMES)
+        print(f"{name}: {count} rows")
+    print(f"Compacted {len(names)} logs")
+
+
+if __name__ == "__main__":
+    main()
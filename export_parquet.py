@@ -0,0 +1,230 @@
+"""
+Compact per-participant conversation files into partitioned Parquet for analysis.
+
+Usage:
+    uv run python export_parquet.py [--conversations-dir conversations] [--output-dir analysis]
+                                    [--state-db conversations/state.sqlite3]
+
+Each run only re-reads conversation CSVs (or .jsonl append logs, see
+conversation_log.py) whose size or modification time changed since the last
+run. Rows go to one file per partition,
+<output-dir>/conversations/date=YYYY-MM-DD/condition=XX/part-0.parquet, in row
+groups of ROW_GROUP_ROWS, with a source_file column naming the conversation file
+they came from. Only partitions a changed file contributes to are rewritten: the
+old partition file is read, that file's previous rows are dropped and its new
+rows appended. <output-dir>/manifest.json records each source file's fingerprint
+and the partitions it wrote to. A per-conversation summary table goes to
+<output-dir>/summary.parquet. Load everything with
+pd.read_parquet("analysis/conversations").
+
+With --state-db, rows stored by the SQLite state backend (STATE_BACKEND=sqlite)
+are exported the same way, picking up only files with rows added since last run.
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import sqlite3
+
+import pandas as pd
+
+from conversation_log import LOG_SUFFIX, log_filename, read_rows
+from state_store import CONVERSATION_FIELDNAMES
+
+MANIFEST_NAME = "manifest.json"
+# Bumped when the output layout changes; an older manifest starts a fresh export
+MANIFEST_VERSION = 2
+PART_NAME = "part-0.parquet"
+ROW_GROUP_ROWS = 100_000
+SOURCE_COLUMN = "source_file"
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+        # Written by an older layout (one Parquet file per conversation file): start over
+        shutil.rmtree(os.path.join(output_dir, "conversations"), ignore_errors=True)
+    return {"version": MANIFEST_VERSION, "files": {}, "state_db_watermark": 0}
+
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def split_speaker(content):
+    """Strip the 'Name: ' prefix save_conversation puts in front of every message."""
+    speaker, sep, text = content.partition(": ")
+    return text if sep else content
+
+
+def summarize_conversations(df):
+    """Return one summary dict per conversation_id in df."""
+    summaries = []
+    text = df["content"].fillna("").map(split_speaker)
+    words = text.str.split().str.len().fillna(0).astype(int)
+    is_user = df["chatbot_type"] == "user_message"
+    is_bot = ~is_user & (df["chatbot_type"] != "System_Instruction")
+    for conversation_id, rows in df.groupby("conversation_id", sort=False):
+        first = rows.iloc[0]
+        summaries.append({
+            "conversation_id": conversation_id,
+            "user_id": first["user_id"],
+            "invitation_code": first["invitation_code"],
+            "condition": first["condition"],
+            "participant_stance": first["participant_stance"],
+            "date": first["date"],
+            "messages": len(rows),
+            "participant_turns": int(is_user[rows.index].sum()),
+            "participant_words": int(words[rows.index][is_user[rows.index]].sum()),
+            "bot_replies": int(is_bot[rows.index].sum()),
+            "bot_words": int(words[rows.index][is_bot[rows.index]].sum()),
+        })
+    return summaries
+
+
+class PartitionBatch:
+    """Rows to add to and source files to drop from each partition touched by this run."""
+
+    def __init__(self):
+        self.new_rows = {}  # partition -> list of DataFrames
+        self.dropped_sources = set()
+        self.touched = set()
+
+    def drop_source(self, entry, name):
+        self.dropped_sources.add(name)
+        self.touched.update(entry.get("partitions", []))
+
+    def add_source(self, name, df):
+        """Queue the rows of one conversation file; returns the partitions they go to."""
+        partitions = []
+        for (date, condition), rows in df.groupby(["date", "condition"], sort=False):
+            partition = os.path.join(f"date={date}", f"condition={condition}")
+            rows = rows.drop(columns=["date", "condition"]).assign(**{SOURCE_COLUMN: name})
+            self.new_rows.setdefault(partition, []).append(rows)
+            self.touched.add(partition)
+            partitions.append(partition)
+        return partitions
+
+
+def write_partitions(output_dir, batch):
+    """Rewrite each touched partition as a single file. Returns how many were rewritten."""
+    for partition in sorted(batch.touched):
+        directory = os.path.join(output_dir, "conversations", partition)
+        path = os.path.join(directory, PART_NAME)
+        frames = []
+        if os.path.exists(path):
+            existing = pd.read_parquet(path)
+            frames.append(existing[~existing[SOURCE_COLUMN].isin(batch.dropped_sources)])
+        frames += batch.new_rows.get(partition, [])
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        if df.empty:
+            shutil.rmtree(directory, ignore_errors=True)
+            continue
+        os.makedirs(directory, exist_ok=True)
+        # Hidden name, so a reader listing the partition never picks up a half-written file
+        tmp_path = os.path.join(directory, f".{PART_NAME}.tmp")
+        df.to_parquet(tmp_path, index=False, row_group_size=ROW_GROUP_ROWS)
+        os.replace(tmp_path, path)
+    return len(batch.touched)
+
+
+def export_frame(manifest, batch, name, df, fingerprint):
+    previous = manifest["files"].get(name)
+    if previous:
+        batch.drop_source(previous, name)
+    df = df.reindex(columns=CONVERSATION_FIELDNAMES).fillna("").astype(str)
+    manifest["files"][name] = {
+        **fingerprint,
+        "partitions": batch.add_source(name, df),
+        "summaries": summarize_conversations(df),
+    }
+
+
+def export_csv_files(conversations_dir, manifest, batch):
+    seen = set()
+    changed = 0
+    logs = set(glob.glob(os.path.join(conversations_dir, f"conversation_*{LOG_SUFFIX}")))
+    for path in sorted(glob.glob(os.path.join(conversations_dir, "conversation_*.csv")) + list(logs)):
+        if path.endswith(".csv") and log_filename(path) in logs:
+            continue  # compacted copy of an append log; the log is the source
+        name = os.path.basename(path)
+        seen.add(name)
+        stat = os.stat(path)
+        fingerprint = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        previous = manifest["files"].get(name)
+        if previous and all(previous.get(k) == v for k, v in fingerprint.items()):
+            continue
+        if path.endswith(LOG_SUFFIX):
+            df = pd.DataFrame(read_rows(path, CONVERSATION_FIELDNAMES), columns=CONVERSATION_FIELDNAMES)
+        else:
+            df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        export_frame(manifest, batch, name, df, fingerprint)
+        changed += 1
+
+    # Drop rows of CSV files that no longer exist
+    for name in [n for n, entry in manifest["files"].items() if entry.get("source") != "state_db" and n not in seen]:
+        batch.drop_source(manifest["files"].pop(name), name)
+    return changed
+
+
+def export_state_db(state_db, manifest, batch):
+    conn = sqlite3.connect(f"file:{state_db}?mode=ro", uri=True)
+    try:
+        watermark = manifest.get("state_db_watermark", 0)
+        # Fix the watermark first: rows inserted after this are left for the next run
+        new_watermark = conn.execute("SELECT COALESCE(MAX(id), 0) FROM conversation_rows").fetchone()[0]
+        changed_files = [row[0] for row in conn.execute(
+            "SELECT DISTINCT csv_filename FROM conversation_rows WHERE id > ? AND id <= ?", (watermark, new_watermark)
+        )]
+        for name in changed_files:
+            df = pd.read_sql_query(
+                "SELECT * FROM conversation_rows WHERE csv_filename = ? AND id <= ? ORDER BY id",
+                conn, params=(name, new_watermark)
+            )
+            export_frame(manifest, batch, name, df, {"source": "state_db"})
+        manifest["state_db_watermark"] = new_watermark
+        return len(changed_files)
+    finally:
+        conn.close()
+
+
+def write_summary(output_dir, manifest):
+    summaries = [s for entry in manifest["files"].values() for s in entry["summaries"]]
+    summary = pd.DataFrame(summaries)
+    summary.to_parquet(os.path.join(output_dir, "summary.parquet"), index=False)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export conversation data to partitioned Parquet.")
+    parser.add_argument("--conversations-dir", default="conversations")
+    parser.add_argument("--output-dir", default="analysis")
+    parser.add_argument("--state-db", help="SQLite state store to export rows from (STATE_BACKEND=sqlite)")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest = load_manifest(args.output_dir)
+    batch = PartitionBatch()
+    changed = export_csv_files(args.conversations_dir, manifest, batch)
+    if args.state_db:
+        changed += export_state_db(args.state_db, manifest, batch)
+    rewritten = write_partitions(args.output_dir, batch)
+    summary = write_summary(args.output_dir, manifest)
+    save_manifest(args.output_dir, manifest)
+    print(
+        f"Exported {changed} changed file(s) into {rewritten} partition(s); "
+        f"summary covers {len(summary)} conversation(s)."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Per-bot generation limits and reply clean-up.
+
+The personality prompts ask for short replies ("between 15 and 50 tokens
+maximum"), but without max_tokens a model can still ramble, which costs
+generation time and then a longer simulated typing delay. Each bot gets a
+max_tokens derived from its token range, and replies are cleaned of characters
+the prompts forbid and cut back to a sentence boundary when too long.
+"""
+import logging
+import math
+import re
+
+import metrics
+
+logger = logging.getLogger(f"chat_app.{__name__}")
+
+# Headroom over the prompt's upper bound so a reply can finish its sentence
+MAX_TOKENS_HEADROOM = 1.5
+# Rough English average, used to turn the token budget into a character budget
+CHARS_PER_TOKEN = 4
+
+STOP_SEQUENCES = ["\n\n"]
+
+# How often (in processed replies) to log the truncation rate
+STATS_LOG_EVERY = 50
+
+_EMOJI = re.compile(
+    "[\U0001F000-\U0001FAFF\U00002600-\U000027BF\U0000FE0F\U0000200D\U0001F1E6-\U0001F1FF]+"
+)
+_DASH = re.compile(r"\s*[—–]\s*")
+_COLON = re.compile(r":(?=\s|$)")
+_HASHTAG = re.compile(r"#(\w+)")
+_SPACES = re.compile(r"[ \t]{2,}")
+_SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*(?=\s|$)")
+_CHARACTERS = re.compile(r"\bchar(?:acter)?s?\b", re.IGNORECASE)
+_WORD_BEFORE = re.compile(r"([A-Za-z][A-Za-z.]*)$")
+# Words whose trailing period does not end a sentence (lowercase, inner periods kept)
+ABBREVIATIONS = frozenset({
+    "dr", "mr", "mrs", "ms", "prof", "sr", "jr", "st", "mt", "vs", "e.g", "i.e", "approx",
+    "u.s", "u.k", "u.n", "d.c", "gov", "sen", "rep", "pres", "gen", "col", "lt", "sgt", "capt",
+    "no", "inc", "ltd", "co", "dept", "est", "jan", "feb", "mar", "apr", "aug", "sept", "oct", "nov", "dec",
+})
+
+
+def max_tokens_for(token_range):
+    """
+    max_tokens for a prompt length range such as "15 and 50 tokens maximum" or
+    "30 and 100 characters" (converted at CHARS_PER_TOKEN). Returns None if the
+    range has no number in it.
+    """
+    numbers = [int(n) for n in re.findall(r"\d+", token_range or "")]
+    if not numbers:
+        return None
+    upper = max(numbers)
+    if _CHARACTERS.search(token_range):
+        upper = math.ceil(upper / CHARS_PER_TOKEN)
+    return int(upper * MAX_TOKENS_HEADROOM)
+
+
+def strip_banned_characters(text):
+    """Remove em/en dashes, speech colons, hashtags and emojis the prompts ask bots not to use."""
+    cleaned = _EMOJI.sub("", text)
+    cleaned = _DASH.sub(", ", cleaned)
+    cleaned = _COLON.sub(",", cleaned)
+    cleaned = _HASHTAG.sub(r"\1", cleaned)
+    cleaned = _SPACES.sub(" ", cleaned)
+    return cleaned.strip()
+
+
+def sentence_ends(text):
+    """
+    End offsets of the sentences in text. A period after an abbreviation ("Dr.",
+    "U.S.") or a single initial does not end a sentence.
+    """
+    ends = []
+    for match in _SENTENCE_END.finditer(text):
+        if match.group(0).rstrip("\"')]") == ".":
+            word = _WORD_BEFORE.search(text, 0, match.start())
+            if word and (len(word.group(1)) == 1 or word.group(1).lower() in ABBREVIATIONS):
+                continue
+        ends.append(match.end())
+    return ends
+
+
+def truncate_at_sentence(text, max_chars):
+    """Cut text to at most max_chars, ending at a sentence boundary when there is one."""
+    if len(text) <= max_chars:
+        return text
+    ends = sentence_ends(text[:max_chars])
+    if ends:
+        return text[:ends[-1]].strip()
+    # No full sentence fits: cut at a word boundary and trail off, leaving room for the "..."
+    head = text[:max(max_chars - 3, 0)]
+    return head.rsplit(" ", 1)[0].rstrip(" ,;") + "..."
+
+
+def postprocess_reply(text, max_tokens=None, finish_reason=None):
+    """
+    Clean a bot reply and enforce its length budget.
+
+    A reply cut off by max_tokens (finish_reason "length") is trimmed back to its
+    last complete sentence.
+    """
+    processed = strip_banned_characters(text)
+    if processed != text.strip():
+        metrics.incr("replies_banned_chars_stripped")
+
+    truncated = False
+    if max_tokens:
+        max_chars = max_tokens * CHARS_PER_TOKEN
+        if finish_reason == "length":
+            ends = sentence_ends(processed)
+            if ends and ends[-1] < len(processed):
+                processed = processed[:ends[-1]].strip()
+                truncated = True
+        if len(processed) > max_chars:
+            processed = truncate_at_sentence(processed, max_chars)
+            truncated = True
+
+    if truncated:
+        metrics.incr("replies_truncated")
+    processed_count = metrics.incr("replies_processed")
+    if processed_count % STATS_LOG_EVERY == 0:
+        logger.info(
+            f"Reply post-processing - processed: {processed_count}, "
+            f"truncated: {metrics.ratio('replies_truncated', 'replies_processed'):.1%}, "
+            f"banned characters stripped: {metrics.ratio('replies_banned_chars_stripped', 'replies_processed'):.1%}"
+        )
+    return processed or text.strip()
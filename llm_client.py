@@ -0,0 +1,333 @@
+"""
+Async LLM client on a shared event loop.
+
+Completions run as litellm.acompletion coroutines on one daemon event loop
+thread per process. Retry back-off uses asyncio.sleep, so a waiting call holds
+no thread, and background calls (the opener prefetch, speculative replies)
+need no pool thread at all. The Streamlit script thread bridges in with
+submit(), which returns a concurrent.futures.Future; waiting on it with
+wait_for_reply() blocks only that participant's script run, and only for a
+bounded time.
+
+Before a call starts, the participant's messages go through the local
+pre-screen in content_screen.py; a flagged conversation is sent to the
+fallback model directly instead of waiting for the proxy to reject it.
+Content policy violations are never retried with the same model.
+
+Every request is sent with a timeout (LLM_REQUEST_TIMEOUT_SECONDS per attempt,
+default 20), and callers wait at most LLM_REPLY_TIMEOUT_SECONDS (default 45)
+for a call, retries included, before giving up on it (see wait_for_reply).
+
+Each call can be given an is_alive check (see session_liveness); when it turns
+false, e.g. because the participant closed the tab, the call is cancelled
+along with its HTTP request.
+
+Compare this path with blocking litellm.completion calls in one thread per
+participant with:
+
+    uv run python llm_client.py bench [--participants 50 200 500] [--latency fixed:1.5]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import litellm
+from litellm.exceptions import (
+    BadRequestError, ContentPolicyViolationError, RateLimitError, ServiceUnavailableError, APIConnectionError, InternalServerError,
+    Timeout,
+)
+
+import content_screen
+import metrics
+import profiler
+from background import get_executor
+from usage_ledger import usage_tokens
+
+logger = logging.getLogger(f"chat_app.{__name__}")
+
+# Company LiteLLM proxy; point LLM_API_BASE at mock_proxy.py to work offline
+API_BASE = os.getenv("LLM_API_BASE", "https://litellm.oit.duke.edu/v1")
+API_KEY_ENV = "DUKE_API_KEY"
+
+MAX_RETRIES = 5
+# Per attempt; litellm's own default is 600 seconds
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "20"))
+# How long a script run waits for a call, retries included, before using a filler reply
+REPLY_TIMEOUT_SECONDS = float(os.getenv("LLM_REPLY_TIMEOUT_SECONDS", "45"))
+# How often a running call checks whether its session is still connected
+DISCONNECT_POLL_SECONDS = float(os.getenv("LLM_DISCONNECT_POLL_SECONDS", "1"))
+
+RETRYABLE_ERRORS = (RateLimitError, ServiceUnavailableError, APIConnectionError, InternalServerError, Timeout)
+
+# litellm's default aiohttp transport opens at most 100 connections per process,
+# which caps the calls the shared loop can have in flight; its httpx client allows 1000
+litellm.disable_aiohttp_transport = True
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+class CallRecord:
+    """What happened during one submitted call, handed to on_done for usage accounting."""
+
+    __slots__ = ("label", "model", "attempts", "response", "outcome", "latency", "prescreen")
+
+    def __init__(self, label, model):
+        self.label = label
+        self.model = model
+        self.attempts = 0
+        self.response = None
+        self.outcome = "failed"
+        self.latency = 0.0
+        self.prescreen = None  # why content_screen flagged the request, if it did
+
+    @property
+    def retries(self):
+        return max(self.attempts - 1, 0)
+
+
+def is_content_policy_violation(error):
+    """True for the proxy's content policy rejections, however LiteLLM mapped them."""
+    return isinstance(error, ContentPolicyViolationError) or "ContentPolicyViolationError" in str(error)
+
+
+def configure():
+    """Point LiteLLM at API_BASE with the key from DUKE_API_KEY. Returns False if the key is not set."""
+    api_key = os.getenv(API_KEY_ENV)
+    if not api_key:
+        return False
+    litellm.api_base = API_BASE
+    litellm.api_key = api_key
+    return True
+
+
+def get_loop():
+    """Return the process-wide event loop, starting its thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def session_liveness():
+    """
+    Return an is_alive check for the calling script run's session, or None
+    outside a Streamlit script run.
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    if ctx is None or not Runtime.exists():
+        return None
+    runtime = Runtime.instance()
+    session_id = ctx.session_id
+    return lambda: runtime.is_active_session(session_id)
+
+
+async def _attempt_completion(call, model, messages, params):
+    call.model = model
+    for attempt in range(MAX_RETRIES):
+        try:
+            call.attempts += 1
+            logger.info(f"API call attempt {attempt + 1}/{MAX_RETRIES} to model {model} ({call.label})")
+            response = await litellm.acompletion(model=model, messages=messages, **params)
+
+            # Log token usage information
+            tokens = usage_tokens(response)
+            if tokens["total_tokens"] is not None:
+                logger.info(
+                    f"Token usage - Model: {model}, Prompt: {tokens['prompt_tokens']}, Completion: {tokens['completion_tokens']}, Total: {tokens['total_tokens']}"
+                    + (f", Reasoning: {tokens['reasoning_tokens']}" if tokens["reasoning_tokens"] is not None else "")
+                )
+            else:
+                logger.warning(f"No token usage information available for model {model}")
+
+            logger.info(f"API call successful to model {model} ({call.label})")
+            call.response = response
+            return response
+        except RETRYABLE_ERRORS as e:
+            if attempt < MAX_RETRIES - 1:
+                # Exponential backoff: 0.5s, 1s, 2s, 4s
+                delay = 0.5 * (2 ** attempt)
+                logger.warning(f"API call failed (attempt {attempt + 1}/{MAX_RETRIES}): {type(e).__name__} - retrying in {delay}s")
+                await asyncio.sleep(delay)
+                continue
+            logger.exception(f"API call failed permanently after {MAX_RETRIES} attempts.")
+            raise
+        except BadRequestError as e:
+            if is_content_policy_violation(e):
+                # The same prompt would be rejected again; let the caller fall back right away
+                logger.warning(f"Content policy violation from model {model} ({call.label}) - not retrying")
+                raise
+            if attempt < MAX_RETRIES - 1:
+                logger.warning(f"API call bad request (attempt {attempt + 1}/{MAX_RETRIES}): {str(e)[:100]} - retrying in 0.25s")
+                # Shorter delay for bad requests
+                await asyncio.sleep(0.25)
+                continue
+            logger.exception("API call failed permanently with BadRequestError.")
+            raise
+        except Exception:
+            logger.exception("API call failed with non-retryable error.")
+            raise  # Don't retry auth errors, invalid requests, etc.
+
+
+async def safe_acompletion(call, model, messages, fallback_model, params):
+    """
+    Completion with exponential backoff retries and content policy fallback.
+
+    Retries rate limits, timeouts, and server errors with exponential backoff.
+    Switches to fallback_model for content policy violations, or starts with it
+    when the pre-screen flagged the request, and returns None if that fails too
+    or is the same model. Authentication and malformed request errors are
+    raised immediately.
+    """
+    if call.prescreen is None:
+        try:
+            response = await _attempt_completion(call, model, messages, params)
+            call.outcome = "ok"
+            return response
+        except BadRequestError as e:
+            if not is_content_policy_violation(e):
+                raise
+            metrics.incr("llm_content_policy_violations")
+            if fallback_model == model:
+                logger.warning(f"Content policy violation with {model} and no other fallback model")
+                call.outcome = "content_policy"
+                return None
+            logger.warning(f"Content policy violation with {model}, attempting fallback to {fallback_model}")
+    try:
+        response = await _attempt_completion(call, fallback_model, messages, params)
+    except Exception as fallback_error:
+        logger.error(f"Fallback to {fallback_model} also failed: {type(fallback_error).__name__}")
+        if isinstance(fallback_error, BadRequestError) and is_content_policy_violation(fallback_error):
+            call.outcome = "content_policy"
+        return None
+    logger.info(f"Fallback to {fallback_model} successful" + (f" (pre-screen: {call.prescreen})" if call.prescreen else " after content policy violation"))
+    call.outcome = "fallback"
+    return response
+
+
+async def _cancel_when_disconnected(task, is_alive):
+    while not task.done():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+        if not is_alive():
+            logger.info("Session disconnected - cancelling its LLM call")
+            task.cancel()
+            return
+
+
+def submit(model, messages, fallback_model, label="unknown", on_done=None, is_alive=None, profile=False, **params):
+    """
+    Start a completion on the shared loop and return a concurrent.futures.Future
+    of the response (None when the content policy fallback failed as well).
+
+    on_done(call_record) runs on the background pool once the call has finished,
+    failed or been cancelled; wrap it with background.bind_script_run_ctx to give
+    it the caller's session. is_alive is polled while the call runs. profile=True
+    always samples the call with profiler.py; otherwise PROFILE_SAMPLE_RATE applies.
+    Each attempt times out after REQUEST_TIMEOUT_SECONDS unless params set timeout.
+    """
+    params.setdefault("timeout", REQUEST_TIMEOUT_SECONDS)
+    call = CallRecord(label, model)
+    if fallback_model != model:
+        call.prescreen = content_screen.screen_messages(messages)
+        if call.prescreen is not None:
+            metrics.incr("llm_prescreen_flagged")
+            logger.info(f"Pre-screen flagged the request ({call.prescreen}) - calling {fallback_model} directly ({label})")
+
+    async def run():
+        started = time.monotonic()
+        metrics.incr("llm_calls_inflight")
+        watcher = asyncio.create_task(_cancel_when_disconnected(asyncio.current_task(), is_alive)) if is_alive else None
+        try:
+            with profiler.profile("llm_call", forced=profile):
+                return await safe_acompletion(call, model, messages, fallback_model, params)
+        except asyncio.CancelledError:
+            call.outcome = "cancelled"
+            metrics.incr("llm_calls_cancelled")
+            raise
+        finally:
+            call.latency = time.monotonic() - started
+            metrics.incr("llm_calls_inflight", -1)
+            if watcher is not None:
+                watcher.cancel()
+            if on_done is not None:
+                get_executor().submit(on_done, call)
+
+    return asyncio.run_coroutine_threadsafe(run(), get_loop())
+
+
+def wait_for_reply(future, timeout=None):
+    """
+    Block until a submitted call's response is ready, for at most timeout seconds
+    (REPLY_TIMEOUT_SECONDS by default). On timeout the call is cancelled and
+    TimeoutError is raised, so a stalled proxy cannot pin the script thread.
+    """
+    try:
+        return future.result(timeout=REPLY_TIMEOUT_SECONDS if timeout is None else timeout)
+    except TimeoutError:
+        future.cancel()
+        metrics.incr("llm_calls_timed_out")
+        raise
+
+
+def benchmark(participant_counts, latency, api_base):
+    """
+    Simulate participants each waiting on one reply: blocking calls in one
+    thread each, then coroutines on the shared loop. Without api_base the calls
+    go to an in-process mock_proxy with the given latency distribution.
+    Reports wall time, throughput and peak thread count.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if api_base is None:
+        import mock_proxy
+
+        api_base = mock_proxy.start_in_thread(mock_proxy.MockProxy(latency=latency, seed=0))
+
+    params = {"api_base": api_base, "api_key": "bench"}
+    messages = [{"role": "user", "content": "hi"}]
+    for participants in participant_counts:
+        peak_threads = threading.active_count()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(participants) as pool:
+            futures = [pool.submit(litellm.completion, model="openai/bench", messages=messages, **params) for _ in range(participants)]
+            peak_threads = max(peak_threads, threading.active_count())
+            for future in futures:
+                future.result()
+        blocking = time.perf_counter() - started
+
+        started = time.perf_counter()
+        futures = [submit("openai/bench", messages, "openai/bench", label="bench", **params) for _ in range(participants)]
+        async_threads = threading.active_count()
+        for future in futures:
+            future.result()
+        asynchronous = time.perf_counter() - started
+
+        print(
+            f"{participants:5} participants  blocking: {blocking:6.2f}s {participants / blocking:7.1f} replies/s {peak_threads:5} threads  |  "
+            f"async: {asynchronous:6.2f}s {participants / asynchronous:7.1f} replies/s {async_threads:5} threads"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark blocking vs async LLM calls.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench = subparsers.add_parser("bench", help="Compare concurrent participants on each path")
+    bench.add_argument("--participants", type=int, nargs="+", default=[50, 200, 500])
+    bench.add_argument("--latency", default="fixed:1.5", help="Latency distribution of the mock proxy (see mock_proxy.py)")
+    bench.add_argument("--api-base", help="Use this OpenAI-compatible endpoint instead of an in-process mock proxy")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    benchmark(args.participants, args.latency, args.api_base)
+
+
+if __name__ == "__main__":
+    main()
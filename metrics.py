@@ -0,0 +1,63 @@
+"""
+Process-wide counters and recent events for the chat app.
+
+Kept in memory only; helpers log a summary line now and then so the numbers
+show up in `docker logs` next to the per-session messages. The chat path also
+records one event per LLM call, conversation write and turn in a ring buffer
+of the last METRICS_EVENT_BUFFER events, which the operator dashboard
+(pages/operator_dashboard.py) summarises.
+"""
+import os
+import threading
+import time
+from collections import Counter, deque
+
+EVENT_BUFFER_SIZE = int(os.getenv("METRICS_EVENT_BUFFER", "20000"))
+
+_counters = Counter()
+_events = deque(maxlen=EVENT_BUFFER_SIZE)
+_lock = threading.Lock()
+
+
+def incr(name, amount=1):
+    """Add amount to a counter and return its new value."""
+    with _lock:
+        _counters[name] += amount
+        return _counters[name]
+
+
+def get(name):
+    with _lock:
+        return _counters[name]
+
+
+def snapshot():
+    """Copy of all counters."""
+    with _lock:
+        return dict(_counters)
+
+
+def ratio(numerator, denominator):
+    """numerator / denominator as a float, 0.0 when the denominator is still 0."""
+    with _lock:
+        total = _counters[denominator]
+        return _counters[numerator] / total if total else 0.0
+
+
+def record_event(kind, **fields):
+    """Add one event to the ring buffer; the oldest event drops off once it is full."""
+    event = (time.time(), kind, fields)
+    with _lock:
+        _events.append(event)
+
+
+def recent_events(kind=None, since=None):
+    """(timestamp, kind, fields) events of kind (default: all) newer than since, oldest first."""
+    with _lock:
+        events = list(_events)
+    return [e for e in events if (kind is None or e[1] == kind) and (since is None or e[0] >= since)]
+
+
+def event_count():
+    with _lock:
+        return len(_events)
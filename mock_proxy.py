@@ -0,0 +1,243 @@
+"""
+Local OpenAI-compatible stand-in for the LiteLLM proxy, for offline testing
+and benchmarking.
+
+    uv run python mock_proxy.py [--port 4000] [--latency lognormal:0.3,0.5]
+                                [--rate-limit-rate 0.05] [--server-error-rate 0.02]
+                                [--content-policy-rate 0.01] [--content-policy-pattern "(?i)bomb"]
+
+Point the app at it with:
+
+    LLM_API_BASE=http://localhost:4000/v1 DUKE_API_KEY=mock uv run python serve.py
+
+It serves POST /v1/chat/completions, with and without stream=true, plus
+GET /v1/models and GET /health. Replies are short canned chat lines that
+respect max_tokens and stop sequences. Usage payloads estimate tokens at
+about four characters each. Latency is drawn per request from
+--latency, which takes one of:
+
+    fixed:S              always S seconds
+    uniform:A,B          between A and B seconds
+    normal:MEAN,SD       clipped at 0
+    lognormal:MU,SIGMA   of the underlying normal, in log-seconds
+
+Streaming replies send their first chunk after that latency, then one chunk
+every 1/--tokens-per-second seconds. Errors are injected at the given rates:
+429 rate limits, 500/503 server errors, and 400 content policy violations
+shaped like the proxy's. --content-policy-pattern always triggers the last one
+when it matches the last user message. --seed makes runs repeatable.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+from aiohttp import web
+
+CHARS_PER_TOKEN = 4
+
+REPLIES = [
+    "idk, I think it's more complicated than that tbh",
+    "Yeah that's fair, but who's paying for all of it?",
+    "Honestly I just don't see it the same way you do",
+    "I hear you. Still think we have bigger problems at home",
+    "That's kind of my point though, you know",
+    "Not sure I buy that, what makes you say so?",
+    "Right, and that's exactly why it matters so much",
+    "Eh, people have been saying that for years",
+]
+
+
+def parse_latency(spec):
+    """Turn a --latency spec into a function returning one latency in seconds."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",")] if args else []
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal" and len(values) == 2:
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    raise ValueError(f"Bad latency spec '{spec}' (expected fixed:S, uniform:A,B, normal:MEAN,SD or lognormal:MU,SIGMA)")
+
+
+def estimate_tokens(text):
+    return max(1, round(len(text) / CHARS_PER_TOKEN))
+
+
+def message_text(message):
+    content = message.get("content") or ""
+    if isinstance(content, list):  # multi-part content
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+class MockProxy:
+    def __init__(self, latency="lognormal:0.3,0.5", tokens_per_second=40.0, rate_limit_rate=0.0,
+                 server_error_rate=0.0, content_policy_rate=0.0, content_policy_pattern=None, seed=None):
+        self.latency = parse_latency(latency)
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.content_policy_rate = content_policy_rate
+        self.content_policy_pattern = re.compile(content_policy_pattern) if content_policy_pattern else None
+        self.rng = random.Random(seed)
+        self.requests = 0
+
+    def app(self):
+        app = web.Application()
+        for prefix in ("/v1", ""):
+            app.router.add_post(f"{prefix}/chat/completions", self.chat_completions)
+            app.router.add_get(f"{prefix}/models", self.models)
+        app.router.add_get("/health", self.health)
+        return app
+
+    async def health(self, request):
+        return web.json_response({"status": "ok", "requests": self.requests})
+
+    async def models(self, request):
+        return web.json_response({"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+
+    def _error(self, status, message, error_type, code):
+        return web.json_response(
+            {"error": {"message": message, "type": error_type, "param": None, "code": code}}, status=status
+        )
+
+    def _injected_error(self, messages):
+        last_user = next((message_text(m) for m in reversed(messages) if m.get("role") == "user"), "")
+        if (self.content_policy_pattern and self.content_policy_pattern.search(last_user)) or self.rng.random() < self.content_policy_rate:
+            return self._error(
+                400,
+                "litellm.ContentPolicyViolationError: The response was filtered due to the prompt triggering "
+                "the content management policy. Please modify your prompt and retry.",
+                "invalid_request_error", "content_policy_violation",
+            )
+        roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            response = self._error(429, "Rate limit exceeded. Please retry shortly.", "rate_limit_error", "rate_limit_exceeded")
+            response.headers["Retry-After"] = "1"
+            return response
+        if roll < self.rate_limit_rate + self.server_error_rate:
+            status = self.rng.choice([500, 503])
+            return self._error(status, "The server had an error while processing your request.", "server_error", None)
+        return None
+
+    def _reply(self, body):
+        """Reply text and finish reason, honouring max_tokens and stop sequences."""
+        text = self.rng.choice(REPLIES)
+        finish_reason = "stop"
+        stop = body.get("stop") or []
+        for sequence in [stop] if isinstance(stop, str) else stop:
+            if sequence and sequence in text:
+                text = text[:text.index(sequence)]
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+        if max_tokens and estimate_tokens(text) > max_tokens:
+            text = text[:max_tokens * CHARS_PER_TOKEN].rsplit(" ", 1)[0]
+            finish_reason = "length"
+        return text, finish_reason
+
+    def _usage(self, messages, text):
+        prompt_tokens = sum(estimate_tokens(message_text(m)) + 4 for m in messages)
+        completion_tokens = estimate_tokens(text)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "completion_tokens_details": {"reasoning_tokens": 0},
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+
+    async def chat_completions(self, request):
+        self.requests += 1
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            return self._error(400, "Request body is not valid JSON.", "invalid_request_error", None)
+        messages = body.get("messages") or []
+        if not messages:
+            return self._error(400, "'messages' is required.", "invalid_request_error", None)
+
+        await asyncio.sleep(self.latency(self.rng))
+        error = self._injected_error(messages)
+        if error is not None:
+            return error
+
+        text, finish_reason = self._reply(body)
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "mock")
+        usage = self._usage(messages, text)
+        if not body.get("stream"):
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+        return await self._stream(request, completion_id, model, text, finish_reason, usage, body)
+
+    async def _stream(self, request, completion_id, model, text, finish_reason, usage, body):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+
+        async def send(delta, finish=None, **extra):
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}], **extra,
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+
+        await send({"role": "assistant", "content": ""})
+        for piece in re.findall(r"\S+\s*", text):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            await send({"content": piece})
+        await send({}, finish_reason)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model, "choices": [], "usage": usage}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+def start_in_thread(proxy, host="127.0.0.1", port=0):
+    """Serve proxy on a daemon thread and return its API base URL (ending in /v1)."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="mock-proxy", daemon=True).start()
+    runner = web.AppRunner(proxy.app(), access_log=None)
+    asyncio.run_coroutine_threadsafe(runner.setup(), loop).result()
+    site = web.TCPSite(runner, host, port)
+    asyncio.run_coroutine_threadsafe(site.start(), loop).result()
+    return f"http://{host}:{runner.addresses[0][1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible mock of the LiteLLM proxy.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=4000)
+    parser.add_argument("--latency", default="lognormal:0.3,0.5", help="Latency distribution (see module docstring)")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0, help="Streaming speed")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Fraction answered with 500/503")
+    parser.add_argument("--content-policy-rate", type=float, default=0.0, help="Fraction answered with a content policy violation")
+    parser.add_argument("--content-policy-pattern", help="Regex on the last user message that always triggers a violation")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    proxy = MockProxy(
+        args.latency, args.tokens_per_second, args.rate_limit_rate, args.server_error_rate,
+        args.content_policy_rate, args.content_policy_pattern, args.seed,
+    )
+    print(f"Mock proxy on http://{args.host}:{args.port}/v1 (latency {args.latency})")
+    web.run_app(proxy.app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
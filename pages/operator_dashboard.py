@@ -0,0 +1,167 @@
+"""
+Live operator dashboard, served by the app at /operator_dashboard.
+
+Everything shown comes from memory: the recent events the chat path records in
+metrics.py, the session registry and the admission controller. Refreshing it
+reads no conversation files. Each worker keeps its own events, so with several
+workers the page shows the one that served it.
+
+Locked unless OPERATOR_DASHBOARD_PASSWORD is set.
+"""
+import hmac
+import math
+import os
+import time
+from collections import Counter
+from datetime import datetime
+
+import streamlit as st
+from dotenv import load_dotenv
+
+import metrics
+from admission import get_admission_controller
+from session_registry import sessions_by_condition
+
+load_dotenv()
+
+PASSWORD = os.getenv("OPERATOR_DASHBOARD_PASSWORD", "")
+REFRESH_SECONDS = float(os.getenv("OPERATOR_DASHBOARD_REFRESH_SECONDS", "5"))
+# A session counts as active if it had a script or fragment run this recently
+ACTIVE_WITHIN_SECONDS = 300
+WINDOWS = {"Last 5 minutes": 300, "Last 15 minutes": 900, "Last hour": 3600, "Last 4 hours": 14400}
+
+st.set_page_config(page_title="Operator Dashboard", layout="wide")
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of values (q between 0 and 1), None if there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def rate(part, whole):
+    return part / whole if whole else 0.0
+
+
+def fmt_ms(value):
+    return "–" if value is None else f"{value:,.0f} ms"
+
+
+def summarize(window_seconds):
+    """Dashboard numbers for the events of the last window_seconds."""
+    events = metrics.recent_events(since=time.time() - window_seconds)
+    calls = [(ts, fields) for ts, kind, fields in events if kind == "llm_call"]
+    writes = [fields for _, kind, fields in events if kind == "conversation_write"]
+    turns = [fields for _, kind, fields in events if kind == "turn"]
+
+    latencies = [f["latency_ms"] for _, f in calls if f["outcome"] in ("ok", "fallback")]
+    write_ms = [f["write_ms"] for f in writes]
+    tokens_by_minute = Counter()
+    for ts, f in calls:
+        tokens_by_minute[int(ts // 60) * 60] += f["total_tokens"]
+
+    return {
+        "calls": len(calls),
+        "outcomes": Counter(f["outcome"] for _, f in calls),
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "retry_rate": rate(sum(1 for _, f in calls if f["retries"]), len(calls)),
+        "retries_per_call": rate(sum(f["retries"] for _, f in calls), len(calls)),
+        "fallback_rate": rate(sum(1 for _, f in calls if f["outcome"] == "fallback"), len(calls)),
+        "tokens_per_minute": sum(tokens_by_minute.values()) / (window_seconds / 60),
+        "tokens_by_minute": sorted(tokens_by_minute.items()),
+        "writes": len(writes),
+        "write_failures": sum(1 for f in writes if not f["ok"]),
+        "write_p50": percentile(write_ms, 0.5),
+        "write_p95": percentile(write_ms, 0.95),
+        "write_max": max(write_ms, default=None),
+        "turns": Counter(f["condition"] for f in turns),
+        "turn_cpu_p95": percentile([f["cpu_ms"] for f in turns], 0.95),
+    }
+
+
+def require_password():
+    """Stop the page until this browser session has entered OPERATOR_DASHBOARD_PASSWORD."""
+    if not PASSWORD:
+        st.info("The operator dashboard is disabled. Set OPERATOR_DASHBOARD_PASSWORD to enable it.")
+        st.stop()
+    if st.session_state.get("operator_authenticated"):
+        return
+    password = st.text_input("Password", type="password")
+    if password:
+        if hmac.compare_digest(password.encode("utf-8"), PASSWORD.encode("utf-8")):
+            st.session_state["operator_authenticated"] = True
+            st.rerun()
+        st.error("Wrong password.")
+    st.stop()
+
+
+@st.fragment(run_every=REFRESH_SECONDS)
+def dashboard(window_seconds):
+    summary = summarize(window_seconds)
+    active = sessions_by_condition(ACTIVE_WITHIN_SECONDS)
+    in_memory = sessions_by_condition()
+
+    columns = st.columns(6)
+    columns[0].metric("Active sessions", sum(active.values()), help=f"Seen in the last {ACTIVE_WITHIN_SECONDS // 60} minutes")
+    columns[1].metric("LLM p50 latency", fmt_ms(summary["p50"]))
+    columns[2].metric("LLM p95 latency", fmt_ms(summary["p95"]))
+    columns[3].metric("Retry rate", f"{summary['retry_rate']:.1%}", help=f"{summary['retries_per_call']:.2f} retries per call")
+    columns[4].metric("Fallback rate", f"{summary['fallback_rate']:.1%}")
+    columns[5].metric("Tokens / minute", f"{summary['tokens_per_minute']:,.0f}")
+
+    left, right = st.columns(2)
+    with left:
+        st.subheader("Sessions per condition", anchor=False)
+        conditions = sorted(set(in_memory) | set(summary["turns"]), key=str)
+        st.dataframe(
+            {
+                "condition": [str(c) for c in conditions],
+                "active": [active[c] for c in conditions],
+                "in memory": [in_memory[c] for c in conditions],
+                "turns in window": [summary["turns"][c] for c in conditions],
+            },
+            hide_index=True, use_container_width=True,
+        )
+        admission = get_admission_controller()
+        if admission is not None:
+            stats = admission.stats()
+            st.caption(
+                f"Admission: {stats['active']}/{stats['capacity']} chats running, {stats['waiting']} waiting"
+                + (f", latency average {stats['latency_ewma']:.1f}s" if stats["latency_ewma"] is not None else "")
+            )
+
+        st.subheader("Conversation writes", anchor=False)
+        st.markdown(
+            f"{summary['writes']} writes, {summary['write_failures']} failed · "
+            f"p50 {fmt_ms(summary['write_p50'])} · p95 {fmt_ms(summary['write_p95'])} · max {fmt_ms(summary['write_max'])}"
+        )
+
+    with right:
+        st.subheader("LLM calls", anchor=False)
+        st.markdown(
+            f"{summary['calls']} calls · "
+            + " · ".join(f"{outcome} {count}" for outcome, count in summary["outcomes"].most_common())
+            + f" · turn CPU p95 {fmt_ms(summary['turn_cpu_p95'])}"
+        )
+        if summary["tokens_by_minute"]:
+            st.bar_chart(
+                {
+                    "minute": [datetime.fromtimestamp(ts).strftime("%H:%M") for ts, _ in summary["tokens_by_minute"]],
+                    "tokens": [tokens for _, tokens in summary["tokens_by_minute"]],
+                },
+                x="minute", y="tokens", height=220,
+            )
+
+    st.caption(
+        f"Worker {os.getpid()} · {metrics.event_count()}/{metrics.EVENT_BUFFER_SIZE} events buffered · "
+        f"{metrics.get('llm_calls_inflight')} LLM calls in flight · updated {datetime.now().strftime('%H:%M:%S')}"
+    )
+
+
+require_password()
+st.title("Operator Dashboard", anchor=False)
+window = st.selectbox("Window", list(WINDOWS), label_visibility="collapsed")
+dashboard(WINDOWS[window])
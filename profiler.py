@@ -0,0 +1,193 @@
+"""
+Opt-in sampling profiler for live sessions.
+
+With PROFILE=1, a PROFILE_SAMPLE_RATE fraction (default 5%) of script runs,
+chat fragment runs and LLM calls is sampled: a background thread records the
+profiled thread's Python stack every PROFILE_INTERVAL_MS (default 5 ms). When
+PROFILE_ADMIN_TOKEN is set, adding ?profile=<token> to the app URL profiles
+every run of that session, whether or not PROFILE is on.
+
+Stacks are aggregated per label and written to PROFILE_DIR (default
+profiles/) every few profiled runs and at exit:
+
+    <label>.<pid>.collapsed  one "frame;frame;frame count" line per stack, for
+                             flamegraph.pl, speedscope or inferno
+    <label>.<pid>.top.txt    the functions seen in the most samples
+
+LLM calls run on the shared event loop, so their samples also include any
+other calls the loop was serving at the time.
+
+When profiling is off, or a run is not sampled, the only cost is one check.
+"""
+import atexit
+import collections
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import nullcontext
+
+logger = logging.getLogger(f"chat_app.{__name__}")
+
+ENABLED = os.getenv("PROFILE", "0") == "1"
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.05"))
+INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+OUTPUT_DIR = os.getenv("PROFILE_DIR", "profiles")
+ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+# Write the aggregated stacks after this many profiled runs per label
+FLUSH_EVERY = 10
+TOP_FUNCTIONS = 40
+
+
+class _Target:
+    __slots__ = ("thread_id", "label", "root_file", "stacks", "started")
+
+    def __init__(self, thread_id, label, root_file):
+        self.thread_id = thread_id
+        self.label = label
+        self.root_file = root_file
+        self.stacks = collections.Counter()
+        self.started = time.perf_counter()
+
+
+_targets = {}
+_targets_lock = threading.Lock()
+_sampler = None
+_stacks = collections.defaultdict(collections.Counter)  # label -> collapsed stack -> samples
+_runs = collections.Counter()
+_stacks_lock = threading.Lock()
+
+
+def should_profile(forced=False):
+    """Decide whether to profile one run: always when forced, else PROFILE_SAMPLE_RATE of the time."""
+    return forced or (ENABLED and random.random() < SAMPLE_RATE)
+
+
+def admin_requested(token):
+    """True if token (from the ?profile= query parameter) matches PROFILE_ADMIN_TOKEN."""
+    return bool(ADMIN_TOKEN and token) and hmac.compare_digest(str(token), ADMIN_TOKEN)
+
+
+def _collapse(frame, root_file):
+    """Collapsed stack, outermost frame first. Returns (stack, root_seen)."""
+    names = []
+    root_seen = root_file is None
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename == root_file:
+            root_seen = True
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_qualname}")
+        frame = frame.f_back
+    return ";".join(reversed(names)), root_seen
+
+
+def _sample_loop():
+    global _sampler
+    while True:
+        with _targets_lock:
+            if not _targets:
+                _sampler = None
+                return
+            targets = list(_targets.values())
+        frames = sys._current_frames()
+        for target in targets:
+            frame = frames.get(target.thread_id)
+            stack, root_seen = _collapse(frame, target.root_file) if frame is not None else ("", False)
+            if not root_seen:
+                # The script or fragment run this target followed has finished
+                _finish(target)
+                continue
+            target.stacks[stack] += 1
+        del frames
+        time.sleep(INTERVAL_SECONDS)
+
+
+def _start(target):
+    global _sampler
+    with _targets_lock:
+        _targets[id(target)] = target
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_loop, name="profiler", daemon=True)
+            _sampler.start()
+
+
+def _finish(target):
+    with _targets_lock:
+        if _targets.pop(id(target), None) is None:
+            return
+    elapsed_ms = (time.perf_counter() - target.started) * 1000
+    with _stacks_lock:
+        _stacks[target.label].update({f"{target.label};{stack}": n for stack, n in target.stacks.items()})
+        _runs[target.label] += 1
+        flush_due = _runs[target.label] % FLUSH_EVERY == 0
+    logger.info(f"Profiled {target.label}: {elapsed_ms:.1f} ms, {sum(target.stacks.values())} samples")
+    if flush_due:
+        flush(target.label)
+
+
+def profile_script_run(label, forced=False):
+    """
+    Sample the calling thread until the run of the calling file ends, however it
+    ends (st.rerun and st.stop exit by raising). Call at the top of the script or
+    of a fragment function.
+    """
+    if not should_profile(forced):
+        return
+    root_file = sys._getframe(1).f_code.co_filename
+    _start(_Target(threading.get_ident(), label, root_file))
+
+
+class _Profile:
+    __slots__ = ("target",)
+
+    def __init__(self, label, thread_id):
+        self.target = _Target(thread_id, label, None)
+
+    def __enter__(self):
+        _start(self.target)
+        return self
+
+    def __exit__(self, *exc):
+        _finish(self.target)
+        return False
+
+
+def profile(label, forced=False, thread_id=None):
+    """
+    Context manager sampling thread_id (default: the calling thread) while the
+    block runs, if this run is picked by should_profile.
+    """
+    if not should_profile(forced):
+        return nullcontext()
+    return _Profile(label, thread_id or threading.get_ident())
+
+
+def flush(label=None):
+    """Write the aggregated stacks for label (default: every label) to OUTPUT_DIR."""
+    with _stacks_lock:
+        snapshot = {name: collections.Counter(stacks) for name, stacks in _stacks.items() if label in (None, name)}
+    if not snapshot:
+        return
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    for name, stacks in snapshot.items():
+        base = os.path.join(OUTPUT_DIR, f"{name}.{os.getpid()}")
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            for stack, samples in stacks.most_common():
+                f.write(f"{stack} {samples}\n")
+
+        # Inclusive samples per function: count each function once per stack
+        inclusive = collections.Counter()
+        for stack, samples in stacks.items():
+            for function in set(stack.split(";")[1:]):
+                inclusive[function] += samples
+        total = sum(stacks.values())
+        with open(base + ".top.txt", "w", encoding="utf-8") as f:
+            f.write(f"{name}: {_runs[name]} profiled runs, {total} samples every {INTERVAL_SECONDS * 1000:g} ms\n")
+            for function, samples in inclusive.most_common(TOP_FUNCTIONS):
+                f.write(f"{samples / total:7.1%}  {samples:8}  {function}\n")
+
+
+atexit.register(flush)
@@ -0,0 +1,82 @@
+"""
+One-time-use ledger for invite codes.
+
+Each code has one ledger entry in the state store naming the participant and the
+session currently holding it. Claims use set_if_absent / compare_and_set on that
+single key, so redeeming one code never touches or waits on any other code.
+
+A code holds at most one live session. The same participant (userID) may move
+the code to a new session, e.g. after reloading the page, as long as the old
+session was seen within CODE_REUSE_WINDOW_SECONDS; the old session then loses
+the claim. Anyone else is turned away.
+"""
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(f"chat_app.{__name__}")
+
+REUSE_WINDOW_SECONDS = float(os.getenv("CODE_REUSE_WINDOW_SECONDS", "900"))
+
+# Only rewrite last_seen this often, so reruns do not each cost a store write
+HEARTBEAT_INTERVAL_SECONDS = 10
+
+
+def _ledger_key(code):
+    return f"redemption:{code}"
+
+
+def _entry(owner, session_id, claimed_at, last_seen):
+    return json.dumps({"owner": owner, "session": session_id, "claimed_at": claimed_at, "last_seen": last_seen})
+
+
+def claim_code(store, code, owner, session_id, reuse_window=None, now=None):
+    """
+    Try to claim code for session_id. Returns True if the session now holds it.
+    """
+    reuse_window = REUSE_WINDOW_SECONDS if reuse_window is None else reuse_window
+    now = time.time() if now is None else now
+    key = _ledger_key(code)
+
+    if store.set_if_absent(key, _entry(owner, session_id, now, now)):
+        logger.info("Invite code redeemed for the first time")
+        return True
+
+    current = store.get(key)
+    holder = json.loads(current)
+    if holder["session"] == session_id:
+        return True
+    if holder["owner"] != owner:
+        logger.warning("Invite code claim rejected - code redeemed by another participant")
+        return False
+    if now - holder["last_seen"] > reuse_window:
+        logger.warning("Invite code claim rejected - reuse window expired")
+        return False
+
+    # Reconnect by the same participant: move the claim to this session
+    if store.compare_and_set(key, current, _entry(owner, session_id, holder["claimed_at"], now)):
+        logger.info("Invite code claim moved to new session (reconnect)")
+        return True
+    logger.warning("Invite code claim lost a concurrent race")
+    return False
+
+
+def heartbeat(store, code, session_id, now=None):
+    """
+    Refresh the claim held by session_id. Returns False if another session took it over.
+    """
+    now = time.time() if now is None else now
+    key = _ledger_key(code)
+    current = store.get(key)
+    if current is None:
+        return False
+    holder = json.loads(current)
+    if holder["session"] != session_id:
+        return False
+    if now - holder["last_seen"] >= HEARTBEAT_INTERVAL_SECONDS:
+        # A failed CAS here means a reconnect just moved the claim away
+        return store.compare_and_set(
+            key, current, _entry(holder["owner"], session_id, holder["claimed_at"], now)
+        )
+    return True
@@ -0,0 +1,138 @@
+"""
+Opt-in reply cache for short, repetitive participant turns.
+
+Participants often answer with "idk", "why?" or "ok", and each of those costs a
+full-context completion. With REPLY_CACHE=1, a bot's reply is cached under
+(study, bot, condition, normalized last participant message) together with a
+character-trigram signature of the preceding turns. A later short turn reuses a
+cached reply only when its context is similar enough (Jaccard similarity of the
+signatures) and the reply has not already been shown in that conversation.
+
+Entries expire after REPLY_CACHE_TTL_SECONDS and the least recently used keys
+are dropped beyond REPLY_CACHE_SIZE.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(f"chat_app.{__name__}")
+
+ENABLED = os.getenv("REPLY_CACHE", "0") == "1"
+MAX_KEYS = int(os.getenv("REPLY_CACHE_SIZE", "2000"))
+TTL_SECONDS = float(os.getenv("REPLY_CACHE_TTL_SECONDS", "1800"))
+MIN_SIMILARITY = float(os.getenv("REPLY_CACHE_SIMILARITY", "0.6"))
+# Only participant messages up to this many words are served from the cache
+MAX_WORDS = int(os.getenv("REPLY_CACHE_MAX_WORDS", "4"))
+# Turns before the participant's message that make up the context signature
+CONTEXT_TURNS = 3
+ENTRIES_PER_KEY = 8
+STATS_LOG_EVERY = 50
+
+_NON_WORD = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text):
+    return _SPACES.sub(" ", _NON_WORD.sub("", text.lower())).strip()
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _similarity(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class _Entry:
+    __slots__ = ("signature", "reply", "created")
+
+    def __init__(self, signature, reply, created):
+        self.signature = signature
+        self.reply = reply
+        self.created = created
+
+
+class ReplyCache:
+    def __init__(self, max_keys=MAX_KEYS, ttl_seconds=TTL_SECONDS, min_similarity=MIN_SIMILARITY):
+        self.max_keys = max_keys
+        self.ttl_seconds = ttl_seconds
+        self.min_similarity = min_similarity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _split(messages):
+        """(normalized last participant message, context signature), or None if the turn is not cacheable."""
+        if not messages or messages[-1].role != "user":
+            return None
+        last = normalize(messages[-1].content)
+        if not last or len(last.split()) > MAX_WORDS:
+            return None
+        context = " | ".join(normalize(m.content) for m in messages[-1 - CONTEXT_TURNS:-1])
+        return last, _trigrams(context)
+
+    def lookup(self, study_id, bot_name, condition, messages, shown_replies=()):
+        """
+        Return a cached reply for this turn, or None. study_id is part of the key:
+        studies served by the same process may reuse bot names and condition labels.
+        """
+        split = self._split(messages)
+        if split is None:
+            return None
+        last, signature = split
+        key = (study_id, bot_name, condition, last)
+        shown = {normalize(r) for r in shown_replies}
+        now = time.monotonic()
+        reply = None
+        with self._lock:
+            entries = self._entries.get(key)
+            if entries:
+                entries[:] = [e for e in entries if now - e.created <= self.ttl_seconds]
+                best = max(
+                    (e for e in entries if normalize(e.reply) not in shown),
+                    key=lambda e: _similarity(signature, e.signature),
+                    default=None,
+                )
+                if best is not None and _similarity(signature, best.signature) >= self.min_similarity:
+                    reply = best.reply
+                    self._entries.move_to_end(key)
+
+        lookups = metrics.incr("reply_cache_lookups")
+        if reply is not None:
+            metrics.incr("reply_cache_hits")
+        if lookups % STATS_LOG_EVERY == 0:
+            logger.info(f"Reply cache - lookups: {lookups}, hit rate: {metrics.ratio('reply_cache_hits', 'reply_cache_lookups'):.1%}")
+        return reply
+
+    def store(self, study_id, bot_name, condition, messages, reply, private_terms=()):
+        """Cache reply for this turn. Replies naming anything in private_terms (e.g. the invitation code) are skipped."""
+        split = self._split(messages)
+        if split is None or any(term and term in reply for term in private_terms):
+            return
+        last, signature = split
+        key = (study_id, bot_name, condition, last)
+        with self._lock:
+            entries = self._entries.setdefault(key, [])
+            entries.append(_Entry(signature, reply, time.monotonic()))
+            del entries[:-ENTRIES_PER_KEY]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+        metrics.incr("reply_cache_stores")
+
+
+_cache = ReplyCache()
+
+
+def get_reply_cache():
+    """The process-wide cache, or None when REPLY_CACHE is not enabled."""
+    return _cache if ENABLED else None
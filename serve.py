@@ -0,0 +1,232 @@
+"""
+Launch the Streamlit app with everything heavy loaded before the first participant.
+
+    uv run python serve.py [streamlit options, e.g. --server.port=8501]
+
+Imports litellm and the app's modules, starts the LLM event loop, compiles
+every study, loads the optional content screen classifier and the invite codes, then runs `streamlit run app.py` in the
+same process, so app.py finds all of it already in memory. With
+PREWARM_LLM_PING=1 it also sends a one-token completion to open the connection
+to the proxy.
+
+While it starts, GET http://<host>:READINESS_PORT/ready (default 8502) answers
+503; once every step has succeeded and Streamlit is running it answers 200.
+Both carry a JSON report of each step and how long it took.
+
+    uv run python serve.py importtime [--output importtime.txt] [--budget 20]
+
+profiles the same imports with `python -X importtime` and fails if they take
+longer than --budget seconds; the Docker build runs it to catch regressions.
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("chat_app.serve")
+
+READINESS_PORT = int(os.getenv("READINESS_PORT", "8502"))
+
+# What app.py imports that is slow enough to matter, plus the app's own modules
+PREWARM_MODULES = [
+    "litellm",
+    "streamlit.components.v1",
+    "dotenv",
+    "llm_client",
+    "content_screen",
+    "state_store",
+    "study_config",
+    "assignment",
+    "redemption",
+    "static_assets",
+    "chat_records",
+    "session_registry",
+    "generation_policy",
+    "reply_cache",
+    "speculative",
+    "usage_ledger",
+]
+
+_status = {"ready": False, "steps": {}}
+_status_lock = threading.Lock()
+
+
+def import_modules():
+    for name in PREWARM_MODULES:
+        importlib.import_module(name)
+
+
+def warm_llm_client():
+    import llm_client
+    import study_config
+
+    if not llm_client.configure():
+        raise RuntimeError(f"{llm_client.API_KEY_ENV} is not set")
+    llm_client.get_loop()
+    if os.getenv("PREWARM_LLM_PING", "0") == "1":
+        model = study_config.load_study().model
+        llm_client.submit(model, [{"role": "user", "content": "ping"}], model, label="prewarm", max_tokens=1).result(timeout=60)
+
+
+def load_content_classifier():
+    import content_screen
+
+    content_screen.get_classifier()
+
+
+def compile_studies():
+    import study_config
+
+    study_config.load_all_studies()
+
+
+def load_invite_codes():
+    import study_config
+    from state_store import get_state_store
+
+    for storage in {study.storage for study in study_config.load_all_studies().values()}:
+        get_state_store(storage).invite_codes()
+
+
+def hash_static_assets():
+    import static_assets
+
+    for name in os.listdir(static_assets.STATIC_DIR):
+        static_assets.asset_url(name)
+
+
+PREWARM_STEPS = [
+    ("imports", import_modules),
+    ("studies", compile_studies),
+    ("llm_client", warm_llm_client),
+    ("content_classifier", load_content_classifier),
+    ("invite_codes", load_invite_codes),
+    ("static_assets", hash_static_assets),
+]
+
+
+def prewarm():
+    """Run every prewarm step, recording how long each took. Failures are logged, not raised."""
+    ok = True
+    for name, step in PREWARM_STEPS:
+        started = time.perf_counter()
+        error = None
+        try:
+            step()
+        except Exception as e:
+            logger.exception(f"Prewarm step {name} failed")
+            error = f"{type(e).__name__}: {e}"
+            ok = False
+        seconds = round(time.perf_counter() - started, 3)
+        with _status_lock:
+            _status["steps"][name] = {"ok": error is None, "seconds": seconds, "error": error}
+        logger.info(f"Prewarm step {name}: {seconds}s" + (f" ({error})" if error else ""))
+    with _status_lock:
+        _status["ready"] = ok
+    return ok
+
+
+def readiness():
+    from streamlit.runtime import Runtime
+
+    with _status_lock:
+        report = {"ready": _status["ready"], "steps": dict(_status["steps"])}
+    report["streamlit"] = Runtime.exists()
+    report["ready"] = report["ready"] and report["streamlit"]
+    return report
+
+
+class ReadinessHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/ready":
+            self.send_error(404)
+            return
+        report = readiness()
+        body = json.dumps(report).encode("utf-8")
+        self.send_response(200 if report["ready"] else 503)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # health checks would flood the logs
+
+
+def start_readiness_server(port=READINESS_PORT):
+    server = ThreadingHTTPServer(("0.0.0.0", port), ReadinessHandler)
+    threading.Thread(target=server.serve_forever, name="readiness", daemon=True).start()
+    logger.info(f"Readiness endpoint on :{port}/ready")
+    return server
+
+
+def profile_imports(output=None, budget=None):
+    """Time PREWARM_MODULES with -X importtime in a fresh interpreter. Returns the total seconds."""
+    code = "; ".join(f"import {name}" for name in PREWARM_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        raise SystemExit(result.returncode)
+
+    # Lines look like "import time:   self [us] | cumulative | imported package"
+    entries = []
+    for line in result.stderr.splitlines():
+        parts = line.removeprefix("import time:").split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            entries.append((int(parts[1]), int(parts[0]), parts[2].rstrip()))
+    top_level = [entry for entry in entries if not entry[2].startswith("  ")]
+    total = sum(cumulative for cumulative, _, _ in top_level) / 1e6
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(result.stderr)
+    print(f"Total import time: {total:.2f}s")
+    print("Slowest imports (cumulative seconds):")
+    for cumulative, _, name in sorted(top_level, reverse=True)[:15]:
+        print(f"  {cumulative / 1e6:7.3f}  {name.strip()}")
+    if budget is not None and total > budget:
+        print(f"Import time {total:.2f}s is over the budget of {budget}s", file=sys.stderr)
+        raise SystemExit(1)
+    return total
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "importtime":
+        parser = argparse.ArgumentParser(description="Profile the app's imports with -X importtime.")
+        parser.add_argument("--output", help="Also write the raw -X importtime report here")
+        parser.add_argument("--budget", type=float, help="Fail if the imports take longer than this many seconds")
+        args = parser.parse_args(sys.argv[2:])
+        profile_imports(args.output, args.budget)
+        return
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | serve | %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    start_readiness_server()
+    started = time.perf_counter()
+    prewarm()
+    logger.info(f"Prewarm finished in {time.perf_counter() - started:.2f}s, starting Streamlit")
+
+    from streamlit.web import cli as stcli
+
+    sys.argv = ["streamlit", "run", os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")] + sys.argv[1:]
+    sys.exit(stcli.main())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Idle session eviction.
+
+Streamlit keeps a session's state until the browser tab goes away, and tabs
+abandoned inside Qualtrics can linger for a long time. Each script run touches
+its session here; a background reaper releases the transcript of sessions idle
+longer than IDLE_SESSION_TIMEOUT_SECONDS. Every message is already written to
+the conversation store when it is sent, so nothing is lost: if the participant
+comes back, the transcript is reloaded from storage. Sessions whose browser
+has disconnected are dropped by the reaper, and the ids of evicted sessions
+are forgotten once their session is gone or after EVICTED_TTL_SECONDS.
+
+Compare resident memory against the number of concurrent sessions, for the
+compact session layout and the old per-session dicts, with:
+
+    uv run python session_registry.py bench [--sessions 250 1000 4000] [--messages 30]
+"""
+import argparse
+import gc
+import logging
+import multiprocessing
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(f"chat_app.{__name__}")
+
+IDLE_SESSION_TIMEOUT_SECONDS = float(os.getenv("IDLE_SESSION_TIMEOUT_SECONDS", "1800"))
+REAPER_INTERVAL_SECONDS = 60
+# Streamlit drops a disconnected session long before this
+EVICTED_TTL_SECONDS = 24 * 3600
+
+
+class _SessionEntry:
+    __slots__ = ("last_seen", "messages", "on_evict", "condition", "is_alive")
+
+    def __init__(self, last_seen, messages, on_evict, condition, is_alive):
+        self.last_seen = last_seen
+        self.messages = messages
+        self.on_evict = on_evict
+        self.condition = condition
+        self.is_alive = is_alive
+
+
+_sessions = {}
+_evicted = {}  # session id -> (evicted at, is_alive)
+_lock = threading.Lock()
+_reaper = None
+
+
+def touch_session(session_id, messages, on_evict=None, condition=None, is_alive=None):
+    """
+    Mark the session active. Returns True if it had been evicted and its
+    transcript needs to be reloaded from storage. is_alive (see
+    llm_client.session_liveness) lets the reaper drop the session once its
+    browser has disconnected.
+    """
+    _ensure_reaper()
+    with _lock:
+        _sessions[session_id] = _SessionEntry(time.monotonic(), messages, on_evict, condition, is_alive)
+        if _evicted.pop(session_id, None) is not None:
+            return True
+    return False
+
+
+def end_session(session_id):
+    with _lock:
+        _sessions.pop(session_id, None)
+        _evicted.pop(session_id, None)
+
+
+def evicted_session_count():
+    with _lock:
+        return len(_evicted)
+
+
+def active_session_count():
+    with _lock:
+        return len(_sessions)
+
+
+def sessions_by_condition(active_within=None):
+    """Count sessions per condition, only those seen in the last active_within seconds if given."""
+    now = time.monotonic()
+    with _lock:
+        return Counter(
+            entry.condition for entry in _sessions.values()
+            if active_within is None or now - entry.last_seen <= active_within
+        )
+
+
+def _disconnected(is_alive):
+    try:
+        return is_alive is not None and not is_alive()
+    except Exception:
+        logger.exception("Session liveness check failed")
+        return False
+
+
+def end_disconnected_sessions():
+    """Forget sessions whose browser has gone, and evicted ids that can no longer come back."""
+    with _lock:
+        live = [(sid, entry.is_alive) for sid, entry in _sessions.items()]
+        evicted = [(sid, is_alive) for sid, (_, is_alive) in _evicted.items()]
+    # Liveness checks run outside the lock; they ask the Streamlit runtime
+    gone = [sid for sid, is_alive in live if _disconnected(is_alive)]
+    gone_evicted = [sid for sid, is_alive in evicted if _disconnected(is_alive)]
+    for sid in gone + gone_evicted:
+        end_session(sid)
+    if gone:
+        logger.info(f"Dropped {len(gone)} disconnected session(s)")
+    return len(gone)
+
+
+def evict_idle_sessions(timeout=None, now=None):
+    """Release the transcripts of sessions idle longer than timeout. Returns how many were evicted."""
+    timeout = IDLE_SESSION_TIMEOUT_SECONDS if timeout is None else timeout
+    now = time.monotonic() if now is None else now
+    with _lock:
+        idle = [(sid, entry) for sid, entry in _sessions.items() if now - entry.last_seen > timeout]
+        for sid, entry in idle:
+            del _sessions[sid]
+            _evicted[sid] = (now, entry.is_alive)
+        for sid in [sid for sid, (evicted_at, _) in _evicted.items() if now - evicted_at > EVICTED_TTL_SECONDS]:
+            del _evicted[sid]
+    for sid, entry in idle:
+        if entry.on_evict is not None:
+            try:
+                entry.on_evict()
+            except Exception:
+                logger.exception("Idle session flush callback failed")
+        # Clear in place: the list object is the one held by the session's state
+        entry.messages.clear()
+    if idle:
+        logger.info(f"Evicted {len(idle)} idle session(s); {active_session_count()} still active")
+    return len(idle)
+
+
+def _reap_forever():
+    while True:
+        time.sleep(REAPER_INTERVAL_SECONDS)
+        try:
+            end_disconnected_sessions()
+            evict_idle_sessions()
+        except Exception:
+            logger.exception("Idle session reaper failed")
+
+
+def _ensure_reaper():
+    global _reaper
+    if _reaper is not None:
+        return
+    with _lock:
+        if _reaper is None:
+            _reaper = threading.Thread(target=_reap_forever, name="idle-session-reaper", daemon=True)
+            _reaper.start()
+
+
+def _rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _bench_sessions(layout, sessions, messages_per_session):
+    """Build `sessions` chat sessions in this (fresh) process; returns RSS before and after."""
+    from chat_records import ChatMessage
+    from study_config import load_study
+
+    study = load_study()
+    personalities = [p for condition in study.conditions.values() for p in condition.personalities]
+    rng = random.Random(0)
+    gc.collect()
+    before = _rss_bytes()
+    states = []
+    for s in range(sessions):
+        code = f"CODE{s:06d}"
+        bot_a, bot_b = rng.sample(personalities, 2)
+        texts = [f"{s}-{i} " + "this is a fairly typical short chat message" * rng.randint(1, 3) for i in range(messages_per_session)]
+        if layout == "compact":
+            # Slotted records, interned names, shared personalities (chat_records.py)
+            messages = [ChatMessage("assistant" if i % 2 else "user", text, bot_a.name if i % 2 else f"{code} (You)") for i, text in enumerate(texts)]
+            state = {"messages": messages, "bot_A": bot_a, "bot_B": bot_b}
+        else:
+            # The earlier layout: dict messages and per-session bot dicts holding the filled-in prompts
+            messages = [{"role": "assistant" if i % 2 else "user", "content": text, "name": f"{bot_a.name}" if i % 2 else f"{code} (You)"} for i, text in enumerate(texts)]
+            state = {
+                "messages": messages,
+                "bot_A": {"name": f"{bot_a.name}", "personality": bot_a.system_message(code)["content"]},
+                "bot_B": {"name": f"{bot_b.name}", "personality": bot_b.system_message(code)["content"]},
+            }
+        states.append(state)
+    gc.collect()
+    return before, _rss_bytes()
+
+
+def benchmark(session_counts, messages_per_session):
+    # A fresh interpreter per measurement, so earlier runs do not inflate RSS
+    context = multiprocessing.get_context("spawn")
+    # Eviction frees a session's transcript for reuse by new sessions, but CPython
+    # rarely hands that memory back to the OS, so RSS is only compared while held
+    print(f"{messages_per_session} messages per session; RSS growth over an empty process")
+    for sessions in session_counts:
+        line = f"{sessions:6} sessions"
+        for layout in ("dicts", "compact"):
+            with context.Pool(1) as pool:
+                before, after = pool.apply(_bench_sessions, (layout, sessions, messages_per_session))
+            grown = after - before
+            line += f"  |  {layout}: {grown / 2**20:7.1f} MiB ({grown / sessions / 1024:5.1f} KiB/session)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-session memory.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench = subparsers.add_parser("bench", help="Resident memory against concurrent session count")
+    bench.add_argument("--sessions", type=int, nargs="+", default=[250, 1000, 4000])
+    bench.add_argument("--messages", type=int, default=30, help="Transcript length per session")
+    args = parser.parse_args()
+    benchmark(args.sessions, args.messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Optional speculative bot replies computed while the participant is typing.
+
+With SPECULATIVE_REPLIES=1, once a turn finishes the app picks the bot that
+will answer next and generates its continuation of the conversation in the
+background. If the participant's next message is one of a fixed set of
+filler turns ("ok", "idk", "true", "lol", ...), that reply is used instead of
+starting a new completion; otherwise it is thrown away.
+
+At most SPECULATIVE_MAX_INFLIGHT speculative calls run per process, and a
+session never has more than one. Counters track how many were used or wasted
+and how much LLM latency the used ones saved.
+"""
+import logging
+import os
+import re
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(f"chat_app.{__name__}")
+
+ENABLED = os.getenv("SPECULATIVE_REPLIES", "0") == "1"
+MAX_INFLIGHT = int(os.getenv("SPECULATIVE_MAX_INFLIGHT", "4"))
+# How long a turn may wait for a speculative reply that is still running
+WAIT_SECONDS = float(os.getenv("SPECULATIVE_WAIT_SECONDS", "2"))
+# Filler turns that add nothing for the next bot to respond to, after
+# normalize_filler(); anything else, however short, gets a fresh reply. Plain
+# yes/no is left out because it can answer a question the bot asked.
+FILLER_TURNS = frozenset({
+    "ok", "okay", "k", "kk", "okie", "oki", "sure", "idk", "i dont know", "dunno",
+    "true", "very true", "so true",
+    "fair", "fair enough", "agreed", "i agree", "same", "right", "exactly", "indeed",
+    "lol", "lmao", "haha", "hahaha", "hmm", "hm", "mhm", "uh huh", "cool", "nice",
+    "interesting", "i see", "got it", "makes sense", "maybe", "perhaps", "whatever",
+    "go on", "continue", "ok cool", "ok sure", "ok lol", "yeah true", "thanks", "thank you",
+})
+STATS_LOG_EVERY = 20
+
+_inflight = threading.BoundedSemaphore(MAX_INFLIGHT)
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+
+def normalize_filler(text):
+    """Lowercase text, drop punctuation and collapse whitespace ("Ok!!  lol." -> "ok lol")."""
+    return " ".join(_NON_WORD.sub("", text.lower()).split())
+
+
+def is_low_information(text):
+    return normalize_filler(text) in FILLER_TURNS
+
+
+class Speculation:
+    """A speculative call in flight: its Future and when it started and finished."""
+
+    __slots__ = ("future", "started", "finished")
+
+    def __init__(self, future, started):
+        self.future = future
+        self.started = started
+        self.finished = None
+
+
+def speculate(start, *args, **kwargs):
+    """
+    Start a call with start(*args, **kwargs), which must return a Future, if the
+    process limit allows. Returns a Speculation, or None if skipped.
+    """
+    if not _inflight.acquire(blocking=False):
+        metrics.incr("speculative_skipped_limit")
+        return None
+    try:
+        speculation = Speculation(start(*args, **kwargs), time.monotonic())
+    except BaseException:
+        _inflight.release()
+        raise
+
+    def settle(_):
+        speculation.finished = time.monotonic()
+        _inflight.release()
+
+    metrics.incr("speculative_started")
+    # Done callbacks also fire for cancelled futures, so the slot is always returned
+    speculation.future.add_done_callback(settle)
+    return speculation
+
+
+def take_result(speculation):
+    """
+    Return the speculative result if it is ready within WAIT_SECONDS, else None
+    (the speculation then counts as wasted).
+    """
+    try:
+        result = speculation.future.result(timeout=WAIT_SECONDS)
+    except Exception:
+        discard(speculation)
+        return None
+    if result is None:
+        discard(speculation)
+        return None
+    metrics.incr("speculative_used")
+    # result() can return just before the done callback has recorded the finish time
+    finished = speculation.finished or time.monotonic()
+    metrics.incr("speculative_latency_saved_ms", round((finished - speculation.started) * 1000))
+    _log_stats()
+    return result
+
+
+def discard(speculation):
+    """Drop a speculation that will not be used, cancelling the call if it is still running."""
+    speculation.future.cancel()
+    metrics.incr("speculative_wasted")
+    _log_stats()
+
+
+def _log_stats():
+    settled = metrics.get("speculative_used") + metrics.get("speculative_wasted")
+    if settled and settled % STATS_LOG_EVERY == 0:
+        logger.info(
+            f"Speculative replies - started: {metrics.get('speculative_started')}, used: {metrics.get('speculative_used')}, "
+            f"wasted: {metrics.get('speculative_wasted')}, skipped at limit: {metrics.get('speculative_skipped_limit')}, "
+            f"latency saved: {metrics.get('speculative_latency_saved_ms') / 1000:.1f}s"
+        )
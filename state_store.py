@@ -0,0 +1,377 @@
+"""
+Shared state backends for the chat app.
+
+By default the app runs as a single Streamlit process and keeps its shared state
+in memory, writing conversations to per-participant CSV files. Setting
+STATE_BACKEND=sqlite switches to a SQLite file that several app.py workers can
+share (put them behind a load balancer with sticky sessions and mount the same
+volume). SQLite stands in for a networked store; any backend only has to offer
+the small key-value and append API below.
+
+Measure how chat turn throughput grows with the number of workers sharing the
+SQLite store with:
+
+    uv run python state_store.py bench [--workers 1 2 4 8] [--turn-cpu-ms 20]
+"""
+import argparse
+import csv
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from filelock import FileLock
+
+from conversation_log import AppendLog, fsync_setting, log_filename, read_rows
+from usage_ledger import USAGE_FIELDNAMES, USAGE_FILENAME
+
+logger = logging.getLogger(f"chat_app.{__name__}")
+
+CONVERSATIONS_DIR = "conversations"
+INVITE_CODES_FILE = "unique_invite_codes.csv"
+
+CONVERSATION_FIELDNAMES = [
+    "conversation_id",
+    "condition",
+    "invitation_code",
+    "participant_stance",
+    "user_id",
+    "date",
+    "hour",
+    "content",
+    "chatbot_type"
+]
+
+
+def read_invite_codes_file(path=INVITE_CODES_FILE):
+    """Read the invite codes CSV into a {code: condition} dict."""
+    codes = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            code = (row.get("code") or "").strip()
+            if code:
+                codes[code] = (row.get("condition") or "").strip()
+    return codes
+
+
+class LocalStateStore:
+    """
+    In-process store for the default single-worker deployment.
+
+    Key-value state lives in a dict guarded by striped locks, so operations on
+    different keys never wait on each other. Conversations are appended to
+    per-participant CSV files under a FileLock, as before, or with
+    conversation_format="jsonl" to lock-free append logs (see conversation_log.py).
+    """
+
+    _STRIPES = 64
+
+    def __init__(self, conversations_dir=CONVERSATIONS_DIR, conversation_format="csv"):
+        if conversation_format not in ("csv", "jsonl"):
+            raise ValueError(f"Unknown conversation format '{conversation_format}' (expected 'csv' or 'jsonl')")
+        self.conversations_dir = conversations_dir
+        self.conversation_format = conversation_format
+        self._append_log = AppendLog(CONVERSATION_FIELDNAMES, fsync_setting()) if conversation_format == "jsonl" else None
+        self._data = {}
+        self._locks = [threading.Lock() for _ in range(self._STRIPES)]
+        self._invite_codes = None
+
+    def _lock_for(self, key):
+        return self._locks[zlib.crc32(key.encode("utf-8")) % self._STRIPES]
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def set(self, key, value):
+        with self._lock_for(key):
+            self._data[key] = value
+
+    def set_if_absent(self, key, value):
+        """Store value only if key is unset. Returns True if this call stored it."""
+        with self._lock_for(key):
+            if key in self._data:
+                return False
+            self._data[key] = value
+            return True
+
+    def compare_and_set(self, key, expected, value):
+        """Replace the value of key only if it currently equals expected."""
+        with self._lock_for(key):
+            if self._data.get(key) != expected:
+                return False
+            self._data[key] = value
+            return True
+
+    def incr(self, key, amount=1):
+        """Atomically add amount to an integer counter and return the new value."""
+        with self._lock_for(key):
+            value = int(self._data.get(key, 0)) + amount
+            self._data[key] = value
+            return value
+
+    def invite_codes(self):
+        if self._invite_codes is None:
+            self._invite_codes = read_invite_codes_file()
+        return self._invite_codes
+
+    def is_invite_code(self, code):
+        return code in self.invite_codes()
+
+    def append_conversation_row(self, row, csv_filename):
+        if not os.path.exists(self.conversations_dir):
+            os.makedirs(self.conversations_dir, exist_ok=True)
+        if self._append_log is not None:
+            self._append_log.append(os.path.join(self.conversations_dir, log_filename(csv_filename)), row)
+            return
+        csv_file = os.path.join(self.conversations_dir, csv_filename)
+        lock_file = csv_file + ".lock"
+        with FileLock(lock_file, timeout=10):  # timeout is optional but helpful
+            file_exists = os.path.isfile(csv_file)
+            with open(csv_file, mode="a", newline='', encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=CONVERSATION_FIELDNAMES)
+                if not file_exists or os.stat(csv_file).st_size == 0:
+                    writer.writeheader()
+                writer.writerow(row)
+
+    def append_usage_row(self, row):
+        if not os.path.exists(self.conversations_dir):
+            os.makedirs(self.conversations_dir, exist_ok=True)
+        usage_file = os.path.join(self.conversations_dir, USAGE_FILENAME)
+        with FileLock(usage_file + ".lock", timeout=10):
+            file_exists = os.path.isfile(usage_file)
+            with open(usage_file, mode="a", newline='', encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=USAGE_FIELDNAMES)
+                if not file_exists or os.stat(usage_file).st_size == 0:
+                    writer.writeheader()
+                writer.writerow(row)
+
+    def load_conversation_rows(self, csv_filename):
+        if self._append_log is not None:
+            log_file = os.path.join(self.conversations_dir, log_filename(csv_filename))
+            return read_rows(log_file, CONVERSATION_FIELDNAMES) if os.path.isfile(log_file) else []
+        csv_file = os.path.join(self.conversations_dir, csv_filename)
+        if not os.path.isfile(csv_file):
+            return []
+        with open(csv_file, newline="", encoding="utf-8") as f:
+            return list(csv.DictReader(f))
+
+
+class SQLiteStateStore:
+    """
+    Store backed by one SQLite file shared by every worker.
+
+    Each thread gets its own connection. WAL mode lets readers run alongside the
+    single writer, and every operation is a single statement, so no application
+    level lock is held across calls.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._invite_codes_seeded = False
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("CREATE TABLE IF NOT EXISTS invite_codes (code TEXT PRIMARY KEY, condition TEXT)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversation_rows ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, csv_filename TEXT, "
+            + ", ".join(f"{name} TEXT" for name in CONVERSATION_FIELDNAMES)
+            + ")"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS conversation_rows_file ON conversation_rows (csv_filename)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            + ", ".join(f"{name} TEXT" for name in USAGE_FIELDNAMES)
+            + ")"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout=10000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set(self, key, value):
+        self._conn().execute(
+            "INSERT INTO kv (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+    def set_if_absent(self, key, value):
+        cursor = self._conn().execute("INSERT OR IGNORE INTO kv (key, value) VALUES (?, ?)", (key, value))
+        return cursor.rowcount == 1
+
+    def compare_and_set(self, key, expected, value):
+        cursor = self._conn().execute(
+            "UPDATE kv SET value = ? WHERE key = ? AND value = ?", (value, key, expected)
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, amount=1):
+        row = self._conn().execute(
+            "INSERT INTO kv (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + CAST(excluded.value AS INTEGER) "
+            "RETURNING value",
+            (key, amount)
+        ).fetchone()
+        return int(row[0])
+
+    def _seed_invite_codes(self):
+        if self._invite_codes_seeded:
+            return
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM invite_codes LIMIT 1").fetchone() is None:
+            # First worker to start seeds the shared table from the CSV file, in one transaction
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR IGNORE INTO invite_codes (code, condition) VALUES (?, ?)",
+                read_invite_codes_file().items()
+            )
+            conn.execute("COMMIT")
+        self._invite_codes_seeded = True
+
+    def invite_codes(self):
+        self._seed_invite_codes()
+        return dict(self._conn().execute("SELECT code, condition FROM invite_codes").fetchall())
+
+    def is_invite_code(self, code):
+        self._seed_invite_codes()
+        # Primary key lookup, no table scan
+        return self._conn().execute("SELECT 1 FROM invite_codes WHERE code = ?", (code,)).fetchone() is not None
+
+    def append_conversation_row(self, row, csv_filename):
+        columns = ", ".join(CONVERSATION_FIELDNAMES)
+        placeholders = ", ".join("?" for _ in CONVERSATION_FIELDNAMES)
+        self._conn().execute(
+            f"INSERT INTO conversation_rows (csv_filename, {columns}) VALUES (?, {placeholders})",
+            [csv_filename] + [row.get(name, "") for name in CONVERSATION_FIELDNAMES]
+        )
+
+    def append_usage_row(self, row):
+        columns = ", ".join(USAGE_FIELDNAMES)
+        placeholders = ", ".join("?" for _ in USAGE_FIELDNAMES)
+        self._conn().execute(
+            f"INSERT INTO usage ({columns}) VALUES ({placeholders})",
+            [row.get(name) for name in USAGE_FIELDNAMES]
+        )
+
+    def load_conversation_rows(self, csv_filename):
+        columns = ", ".join(CONVERSATION_FIELDNAMES)
+        cursor = self._conn().execute(
+            f"SELECT {columns} FROM conversation_rows WHERE csv_filename = ? ORDER BY id", (csv_filename,)
+        )
+        return [dict(zip(CONVERSATION_FIELDNAMES, row)) for row in cursor.fetchall()]
+
+
+_stores = {}
+_store_lock = threading.Lock()
+
+
+def get_state_store(backend="default"):
+    """
+    Return the process-wide store for backend ('local' or 'sqlite'). 'default'
+    uses the backend selected by the STATE_BACKEND env var.
+    """
+    if backend == "default":
+        backend = os.getenv("STATE_BACKEND", "local").lower()
+    with _store_lock:
+        if backend not in _stores:
+            if backend == "sqlite":
+                path = os.getenv("STATE_DB_PATH", os.path.join(CONVERSATIONS_DIR, "state.sqlite3"))
+                _stores[backend] = SQLiteStateStore(path)
+            elif backend == "local":
+                _stores[backend] = LocalStateStore(conversation_format=os.getenv("CONVERSATION_LOG_FORMAT", "csv").lower())
+            else:
+                raise ValueError(f"Unknown STATE_BACKEND '{backend}' (expected 'local' or 'sqlite')")
+            logger.info(f"Using {type(_stores[backend]).__name__} for shared state")
+        return _stores[backend]
+
+
+def _bench_turn(store, session, turn, turn_cpu_seconds):
+    """One chat turn as a worker sees it: script-run CPU plus the turn's state store traffic."""
+    deadline = time.thread_time() + turn_cpu_seconds
+    while time.thread_time() < deadline:
+        pass  # rendering and prompt building hold the GIL
+    conversation = f"conversation_{session}_bench.csv"
+    store.compare_and_set(f"redemption:{session}", "claimed", "claimed")  # heartbeat
+    store.incr("bench:turns")
+    row = {name: f"{name}-{turn}" for name in CONVERSATION_FIELDNAMES}
+    store.append_conversation_row(row, conversation)  # participant message
+    store.append_conversation_row(row, conversation)  # bot reply
+    store.append_usage_row({name: "1" for name in USAGE_FIELDNAMES})
+
+
+def _bench_worker(db_path, worker, sessions, turns, turn_cpu_seconds):
+    store = SQLiteStateStore(db_path)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(sessions) as pool:
+        list(pool.map(
+            lambda i: _bench_turn(store, f"{worker}-{i % sessions}", i, turn_cpu_seconds), range(turns)
+        ))
+    return time.perf_counter() - started
+
+
+def benchmark(worker_counts, turns_per_worker, sessions, turn_cpu_ms):
+    """
+    Run each worker count as separate processes sharing one SQLite store, every
+    worker serving turns_per_worker turns from `sessions` concurrent sessions.
+    Reports turns per second and the speedup over one worker. Workers scale
+    with CPU cores until the store's single writer saturates; --turn-cpu-ms 0
+    measures that ceiling on its own.
+    """
+    print(f"{os.cpu_count()} CPUs, {turn_cpu_ms} ms CPU per turn, {sessions} sessions and {turns_per_worker} turns per worker")
+    baseline = None
+    for workers in worker_counts:
+        directory = tempfile.mkdtemp(prefix="state-store-bench-")
+        try:
+            db_path = os.path.join(directory, "state.sqlite3")
+            SQLiteStateStore(db_path)  # create the schema before the workers race for it
+            started = time.perf_counter()
+            with ProcessPoolExecutor(workers) as pool:
+                list(pool.map(
+                    _bench_worker, [db_path] * workers, range(workers), [sessions] * workers,
+                    [turns_per_worker] * workers, [turn_cpu_ms / 1000] * workers
+                ))
+            elapsed = time.perf_counter() - started
+            rows = SQLiteStateStore(db_path)._conn().execute("SELECT COUNT(*) FROM conversation_rows").fetchone()[0]
+        finally:
+            shutil.rmtree(directory)
+        throughput = workers * turns_per_worker / elapsed
+        baseline = baseline or throughput
+        print(
+            f"{workers:3} workers  {throughput:8.1f} turns/s  speedup {throughput / baseline:5.2f}x  "
+            f"(ideal {min(workers, os.cpu_count() or 1)}x on these CPUs)  {rows} rows written"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the shared SQLite state store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench = subparsers.add_parser("bench", help="Chat turn throughput against the number of workers")
+    bench.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    bench.add_argument("--turns", type=int, default=400, help="Turns per worker")
+    bench.add_argument("--sessions", type=int, default=8, help="Concurrent sessions per worker")
+    bench.add_argument("--turn-cpu-ms", type=float, default=20.0, help="Script-run CPU time per turn")
+    args = parser.parse_args()
+    benchmark(args.workers, args.turns, args.sessions, args.turn_cpu_ms)
+
+
+if __name__ == "__main__":
+    main()
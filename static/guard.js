@@ -0,0 +1,81 @@
+// Prevent right-click context menu
+document.addEventListener('contextmenu', function(e) {
+    e.preventDefault();
+    return false;
+});
+
+// Prevent copy/paste/cut keyboard shortcuts
+document.addEventListener('keydown', function(e) {
+    // Prevent Ctrl+C (copy)
+    if (e.ctrlKey && e.keyCode === 67) {
+        e.preventDefault();
+        return false;
+    }
+    // Prevent Ctrl+V (paste)
+    if (e.ctrlKey && e.keyCode === 86) {
+        e.preventDefault();
+        return false;
+    }
+    // Prevent Ctrl+X (cut)
+    if (e.ctrlKey && e.keyCode === 88) {
+        e.preventDefault();
+        return false;
+    }
+    // Prevent Ctrl+A (select all)
+    if (e.ctrlKey && e.keyCode === 65) {
+        e.preventDefault();
+        return false;
+    }
+    // Prevent Ctrl+S (save)
+    if (e.ctrlKey && e.keyCode === 83) {
+        e.preventDefault();
+        return false;
+    }
+    // Prevent F12 (developer tools)
+    if (e.keyCode === 123) {
+        e.preventDefault();
+        return false;
+    }
+    // Prevent Ctrl+Shift+I (developer tools)
+    if (e.ctrlKey && e.shiftKey && e.keyCode === 73) {
+        e.preventDefault();
+        return false;
+    }
+    // Prevent Ctrl+U (view source)
+    if (e.ctrlKey && e.keyCode === 85) {
+        e.preventDefault();
+        return false;
+    }
+});
+
+// Prevent drag and drop
+document.addEventListener('dragstart', function(e) {
+    e.preventDefault();
+    return false;
+});
+
+// Prevent text selection with mouse
+document.addEventListener('selectstart', function(e) {
+    // Allow selection only in input fields
+    if (e.target.tagName.toLowerCase() === 'input' || 
+        e.target.tagName.toLowerCase() === 'textarea' ||
+        e.target.contentEditable === 'true') {
+        return true;
+    }
+    e.preventDefault();
+    return false;
+});
+
+// Additional prevention for paste events
+document.addEventListener('paste', function(e) {
+    // Allow paste only in input fields
+    if (e.target.tagName.toLowerCase() === 'input' || 
+        e.target.tagName.toLowerCase() === 'textarea' ||
+        e.target.contentEditable === 'true') {
+        return true;
+    }
+    e.preventDefault();
+    return false;
+});
+
+console.log("Copy/paste prevention script loaded");
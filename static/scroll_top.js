@@ -0,0 +1,49 @@
+console.log("Scroll to top script loaded");
+function doScroll() {
+    var container = null;
+    try {
+        if (window.parent && window.parent.document) {
+            container = window.parent.document.querySelector('.stMainBlockContainer');
+            if (container) {
+                console.log("Found container in parent document");
+            } else {
+                console.log("Container not found in parent document");
+            }
+        }
+    } catch (e) {
+        container = document.querySelector('.stMainBlockContainer');
+        if (container) {
+            console.log("Found container in current document");
+        } else {
+            console.log("Container not found in current document");
+        }
+    }
+    if (container) {
+        console.log("Scrolling to top of container");
+        container.scrollIntoView({behavior: 'auto', block: 'start'});
+        setTimeout(function() {
+            if (window.parent && window.parent.scrollTo) {
+                console.log("Scrolling parent window to top");
+                window.parent.scrollTo({ top: 0, left: 0, behavior: 'auto' });
+            }
+            if (window.scrollTo) {
+                console.log("Scrolling current window to top");
+                window.scrollTo({ top: 0, left: 0, behavior: 'auto' });
+            }
+        }, 50);
+    } else {
+        console.log("Container not found, scrolling to top of window");
+        if (window.parent && window.parent.scrollTo) {
+            console.log("Scrolling parent window to top (no container)");
+            window.parent.scrollTo({ top: 0, left: 0, behavior: 'auto' });
+        }
+        if (window.scrollTo) {
+            console.log("Scrolling current window to top (no container)");
+            window.scrollTo({ top: 0, left: 0, behavior: 'auto' });
+        }
+    }
+}
+if ('scrollRestoration' in history) {
+    history.scrollRestoration = 'manual';
+}
+setTimeout(doScroll, 50);
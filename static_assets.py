@@ -0,0 +1,55 @@
+"""
+Chat CSS/JS in ./static, served by Streamlit as a custom component directory.
+
+Instead of sending the full stylesheet and scripts on every rerun, the app emits
+short tags pointing at /component/static_assets.chat_assets/<file>?v=<content hash>.
+Streamlit's /app/static serving sends .css and .js as text/plain, which browsers
+refuse as stylesheets and scripts; the component route sends the real type with
+Cache-Control: public, so browsers cache the files and the hash changes
+whenever a file does.
+"""
+import functools
+import hashlib
+import os
+
+import streamlit.components.v1 as components
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+COMPONENT_NAME = "chat_assets"
+
+
+@functools.lru_cache(maxsize=None)
+def read_asset(name):
+    with open(os.path.join(STATIC_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+@functools.lru_cache(maxsize=None)
+def asset_url(name):
+    """Relative URL with a content hash, resolved against the app's own page."""
+    digest = hashlib.sha256(read_asset(name).encode("utf-8")).hexdigest()[:12]
+    return f"component/{__name__}.{COMPONENT_NAME}/{name}?v={digest}"
+
+
+def register_assets():
+    """
+    Register STATIC_DIR with the running Streamlit server so the asset URLs
+    resolve. Only takes effect inside a script run; registering again is a no-op.
+    """
+    components.declare_component(COMPONENT_NAME, path=STATIC_DIR)
+
+
+def stylesheet_tag(name):
+    register_assets()
+    return f'<style>@import url("{asset_url(name)}");</style>'
+
+
+def script_document(name):
+    """Tiny document for components.html that loads a static script (srcdoc iframes share the app's base URL)."""
+    register_assets()
+    return f'<script src="{asset_url(name)}"></script>'
+
+
+def inline_payload_bytes(names):
+    """Bytes the assets took when inlined, for comparing with the tags that replace them."""
+    return sum(len(read_asset(name).encode("utf-8")) for name in names)
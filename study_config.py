@@ -0,0 +1,194 @@
+"""
+Declarative study configurations.
+
+Each study is a TOML file in studies/ (see studies/ukraine.toml) describing its
+model and fallback model, storage backend, instructions, timing, fallback replies, prompt template,
+bots, opinions and conditions. A file is read, validated and compiled into
+shared BotPersonality objects once per process; the app picks the study with
+the `study` URL parameter (default DEFAULT_STUDY, "ukraine"), so one container
+can serve several studies without a separate app script per study.
+"""
+import functools
+import os
+import re
+import tomllib
+
+from chat_records import INVITATION_CODE_PLACEHOLDER, BotPersonality
+from generation_policy import max_tokens_for
+
+STUDIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "studies")
+DEFAULT_STUDY = os.getenv("DEFAULT_STUDY", "ukraine")
+STORAGE_BACKENDS = ("default", "local", "sqlite")
+
+_STUDY_ID = re.compile(r"^[A-Za-z0-9_-]+$")
+
+BOT_FIELDS = ("personality", "bio", "token_range", "writing_style")
+TIMING_RANGES = ("first_reply_delay_seconds", "bot_to_bot_delay_seconds")
+TIMING_NUMBERS = ("bot_to_bot_probability", "first_reply_typing_cps", "bot_to_bot_typing_cps")
+
+
+class StudyConfigError(ValueError):
+    """Raised when a study file is missing or does not validate."""
+
+
+class StudyCondition:
+    __slots__ = ("personalities", "opener")
+
+    def __init__(self, personalities, opener):
+        self.personalities = personalities
+        self.opener = opener
+
+
+class Study:
+    """A compiled study. Instances are cached and shared by every session."""
+
+    __slots__ = (
+        "id", "model", "fallback_model", "storage", "instructions", "participant_name",
+        "first_reply_delay_seconds", "bot_to_bot_delay_seconds", "bot_to_bot_probability",
+        "first_reply_typing_cps", "bot_to_bot_typing_cps",
+        "first_reply_fallbacks", "bot_to_bot_fallbacks", "opener_reply_fallback",
+        "conditions",
+    )
+
+    def participant_display_name(self, invitation_code):
+        if invitation_code == "unknown_invitation_code":
+            return "You"
+        return self.participant_name.replace(INVITATION_CODE_PLACEHOLDER, invitation_code)
+
+
+def available_studies():
+    return sorted(name[:-5] for name in os.listdir(STUDIES_DIR) if name.endswith(".toml"))
+
+
+def validate_study(raw):
+    """Return a list of problems with a parsed study file (empty if it is valid)."""
+    problems = []
+
+    def section(name):
+        value = raw.get(name)
+        if not isinstance(value, dict):
+            problems.append(f"missing [{name}] table")
+            return {}
+        return value
+
+    study = section("study")
+    for key in ("model", "instructions"):
+        if not isinstance(study.get(key), str) or not study.get(key):
+            problems.append(f"study.{key} must be a non-empty string")
+    if "fallback_model" in study and (not isinstance(study["fallback_model"], str) or not study["fallback_model"]):
+        problems.append("study.fallback_model must be a non-empty string")
+    if study.get("storage", "default") not in STORAGE_BACKENDS:
+        problems.append(f"study.storage must be one of {', '.join(STORAGE_BACKENDS)}")
+
+    timing = section("timing")
+    for key in TIMING_RANGES:
+        value = timing.get(key)
+        if not (isinstance(value, list) and len(value) == 2 and all(isinstance(v, (int, float)) and v >= 0 for v in value) and value[0] <= value[1]):
+            problems.append(f"timing.{key} must be [min, max] seconds")
+    for key in TIMING_NUMBERS:
+        if not isinstance(timing.get(key), (int, float)) or timing.get(key) <= 0:
+            problems.append(f"timing.{key} must be a positive number")
+    if isinstance(timing.get("bot_to_bot_probability"), (int, float)) and timing["bot_to_bot_probability"] > 1:
+        problems.append("timing.bot_to_bot_probability must be at most 1")
+
+    fallbacks = section("fallbacks")
+    for key in ("first_reply", "bot_to_bot"):
+        value = fallbacks.get(key)
+        if not (isinstance(value, list) and value and all(isinstance(v, str) for v in value)):
+            problems.append(f"fallbacks.{key} must be a non-empty list of strings")
+    if not isinstance(fallbacks.get("opener_reply"), str):
+        problems.append("fallbacks.opener_reply must be a string")
+
+    template = section("prompt").get("template")
+    if not isinstance(template, str):
+        problems.append("prompt.template must be a string")
+
+    bots = section("bots")
+    for bot_id, bot in bots.items():
+        for key in BOT_FIELDS:
+            if not isinstance(bot.get(key), str):
+                problems.append(f"bots.{bot_id}.{key} must be a string")
+
+    opinions = section("opinions")
+    conditions = section("conditions")
+    if not conditions:
+        problems.append("at least one condition is required")
+    for name, condition in conditions.items():
+        for key in ("party", "stance", "opener"):
+            if not isinstance(condition.get(key), str):
+                problems.append(f"conditions.{name}.{key} must be a string")
+        bot_ids = condition.get("bots")
+        if not (isinstance(bot_ids, list) and len(bot_ids) == 2):
+            problems.append(f"conditions.{name}.bots must list exactly two bots")
+            continue
+        for bot_id in bot_ids:
+            if bot_id not in bots:
+                problems.append(f"conditions.{name} uses unknown bot {bot_id}")
+            elif bot_id not in opinions.get(condition.get("stance"), {}):
+                problems.append(f"conditions.{name}: no opinions.{condition.get('stance')}.{bot_id}")
+    return problems
+
+
+def _compile_personality(raw, bot_id, party, stance):
+    bot = raw["bots"][bot_id]
+    fields = {key: bot[key] for key in BOT_FIELDS}
+    fields.update(bot_id=bot_id, party=party)
+    fields["opinion"] = raw["opinions"][stance][bot_id].format(**fields)
+    fields["invitation_code"] = INVITATION_CODE_PLACEHOLDER
+    display_name = bot.get("display_name", "{bot_id} ({party})").format(**fields)
+    return BotPersonality(display_name, raw["prompt"]["template"].format(**fields), max_tokens_for(bot["token_range"]))
+
+
+def compile_study(study_id, raw):
+    problems = validate_study(raw)
+    if problems:
+        raise StudyConfigError(f"Invalid study config '{study_id}':\n- " + "\n- ".join(problems))
+
+    study = Study()
+    study.id = study_id
+    study.model = raw["study"]["model"]
+    study.fallback_model = raw["study"].get("fallback_model", study.model)
+    study.storage = raw["study"].get("storage", "default")
+    study.instructions = raw["study"]["instructions"]
+    study.participant_name = raw["study"].get("participant_name", "{invitation_code} (You)")
+    for key in TIMING_RANGES + TIMING_NUMBERS:
+        setattr(study, key, raw["timing"][key])
+    study.first_reply_fallbacks = tuple(raw["fallbacks"]["first_reply"])
+    study.bot_to_bot_fallbacks = tuple(raw["fallbacks"]["bot_to_bot"])
+    study.opener_reply_fallback = raw["fallbacks"]["opener_reply"]
+
+    compiled = {}
+    study.conditions = {}
+    try:
+        for name, condition in raw["conditions"].items():
+            personalities = []
+            for bot_id in condition["bots"]:
+                key = (bot_id, condition["party"], condition["stance"])
+                if key not in compiled:
+                    compiled[key] = _compile_personality(raw, *key)
+                personalities.append(compiled[key])
+            study.conditions[name] = StudyCondition(tuple(personalities), condition["opener"])
+    except (KeyError, IndexError, ValueError) as e:
+        raise StudyConfigError(f"Invalid study config '{study_id}': bad placeholder in prompt or opinion text ({e})") from e
+    return study
+
+
+@functools.lru_cache(maxsize=None)
+def load_study(study_id=DEFAULT_STUDY):
+    """Read, validate and compile a study once per process."""
+    if not _STUDY_ID.match(study_id or ""):
+        raise StudyConfigError(f"Invalid study id '{study_id}'")
+    path = os.path.join(STUDIES_DIR, f"{study_id}.toml")
+    if not os.path.isfile(path):
+        raise StudyConfigError(f"Unknown study '{study_id}'")
+    with open(path, "rb") as f:
+        try:
+            raw = tomllib.load(f)
+        except tomllib.TOMLDecodeError as e:
+            raise StudyConfigError(f"Study config '{study_id}' is not valid TOML: {e}") from e
+    return compile_study(study_id, raw)
+
+
+def load_all_studies():
+    """Compile every study in studies/, e.g. to fail fast at startup."""
+    return {study_id: load_study(study_id) for study_id in available_studies()}
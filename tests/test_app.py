@@ -0,0 +1,70 @@
+"""
+app.py driven through Streamlit's AppTest. LLM calls are avoided by putting the
+session over its token budget, so bots answer with filler replies.
+"""
+import os
+import random
+import time
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import usage_ledger
+from chat_records import ChatMessage
+from redemption import claim_code
+from state_store import get_state_store
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+CODE = "TEST01"
+USER = "user-1"
+CONVERSATION = "conversation-1"
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("DUKE_API_KEY", "test-key")
+    monkeypatch.setenv("STATE_BACKEND", "local")
+    monkeypatch.setattr(usage_ledger, "SESSION_TOKEN_BUDGET", 1)
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(random, "random", lambda: 0.0)  # the other bot always replies too
+    assert claim_code(get_state_store(), CODE, USER, CONVERSATION)
+
+    at = AppTest.from_file(APP, default_timeout=30)
+    at.query_params.update({"study": "ukraine", "condition": "DS", "invitation_code": CODE, "userID": USER})
+    at.session_state["conversation_id"] = CONVERSATION
+    at.session_state["access_code_match"] = True
+    at.session_state["chat_started"] = True
+    at.session_state["needs_initial_gpt"] = False
+    at.session_state["tokens_used"] = 10
+    at.session_state["fragment_runs"] = 0
+    at.session_state["messages"] = [ChatMessage("user", "Should the U.S. keep sending aid?", f"{CODE} (You)")]
+    return at
+
+
+def bot_messages(at):
+    return [m for m in at.session_state["messages"] if m.role == "assistant"]
+
+
+@pytest.mark.parametrize("turn_state, replies", [("first_bot", 2), ("other_bot", 1)])
+def test_full_run_finishes_a_turn_in_progress(app, turn_state, replies):
+    # A reconnect mid-turn runs chat_area as part of a full script run, where
+    # st.rerun(scope="fragment") is not allowed
+    app.session_state["turn_state"] = turn_state
+    app.session_state["turn_bots"] = ("bot_A", "bot_B")
+    app.run()
+
+    assert not app.exception
+    assert app.session_state["turn_state"] == "idle"
+    assert len(bot_messages(app)) == replies
+    assert not app.chat_input[0].disabled
+
+
+def test_full_run_recovers_from_a_failed_turn(app):
+    app.session_state["turn_state"] = "first_bot"
+    app.session_state["turn_bots"] = ("missing_bot", "bot_B")
+    app.run()
+
+    assert not app.exception
+    assert app.session_state["turn_state"] == "idle"
+    assert not bot_messages(app)
@@ -0,0 +1,30 @@
+from generation_policy import postprocess_reply, truncate_at_sentence
+
+
+def test_trailing_off_stays_within_max_chars():
+    text = "honestly i just dont think we should keep sending billions over there when people here are struggling"
+    for max_chars in (10, 25, 40, 60):
+        cut = truncate_at_sentence(text, max_chars)
+        assert cut.endswith("...")
+        assert len(cut) <= max_chars
+
+
+def test_single_long_word_stays_within_max_chars():
+    assert len(truncate_at_sentence("a" * 50, 20)) <= 20
+
+
+def test_abbreviations_do_not_end_a_sentence():
+    text = "I asked Dr. Smith about it. The U.S. has sent a lot already, e.g. tanks and money for years"
+    assert truncate_at_sentence(text, 60) == "I asked Dr. Smith about it."
+    assert truncate_at_sentence(text, 32) == "I asked Dr. Smith about it."
+
+
+def test_no_sentence_boundary_before_an_abbreviation():
+    cut = truncate_at_sentence("Talked to Mr. Jones and Sen. Graham about the aid package yesterday", 30)
+    assert cut != "Talked to Mr." and cut != "Talked to Mr. Jones and Sen."
+    assert cut.endswith("...") and len(cut) <= 30
+
+
+def test_length_cut_reply_ends_at_real_sentence():
+    reply = "Aid matters. Ask Gen. Milley what he thinks about the"
+    assert postprocess_reply(reply, max_tokens=50, finish_reason="length") == "Aid matters."
@@ -0,0 +1,24 @@
+from chat_records import ChatMessage
+from reply_cache import ReplyCache
+
+CONVERSATION = [
+    ChatMessage("assistant", "Aid to Ukraine keeps a lot of people alive", "A017I8 (Democrat)"),
+    ChatMessage("user", "idk", "P1 (You)"),
+]
+
+
+def test_studies_sharing_bot_and_condition_names_do_not_share_replies():
+    cache = ReplyCache()
+    cache.store("ukraine", "A017I8 (Democrat)", "DS", CONVERSATION, "fair, its a tough one")
+
+    assert cache.lookup("ukraine", "A017I8 (Democrat)", "DS", CONVERSATION) == "fair, its a tough one"
+    assert cache.lookup("reps_oppose_aid", "A017I8 (Democrat)", "DS", CONVERSATION) is None
+
+
+def test_each_study_gets_its_own_reply():
+    cache = ReplyCache()
+    cache.store("ukraine", "Bot", "DS", CONVERSATION, "ukraine reply")
+    cache.store("reps_oppose_aid", "Bot", "DS", CONVERSATION, "reps reply")
+
+    assert cache.lookup("ukraine", "Bot", "DS", CONVERSATION) == "ukraine reply"
+    assert cache.lookup("reps_oppose_aid", "Bot", "DS", CONVERSATION) == "reps reply"
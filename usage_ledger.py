@@ -0,0 +1,146 @@
+"""
+Token and cost accounting for LLM calls.
+
+safe_completion records one ledger row per call (tokens, latency, model, retry
+count, outcome) in the conversation store: usage_ledger.csv next to the
+conversation files with the local backend, or the usage table of the SQLite
+state store. Summarize it with:
+
+    uv run python usage_ledger.py [--ledger conversations/usage_ledger.csv | --state-db conversations/state.sqlite3]
+
+which prints per-condition and per-bot totals and latency/token percentiles.
+
+SESSION_TOKEN_BUDGET (total tokens, unset or 0 = no limit) caps a session's
+spend; once it is used up the app switches to BUDGET_FALLBACK_MODEL if set, and
+to filler replies otherwise.
+"""
+import argparse
+import logging
+import os
+import sqlite3
+from datetime import datetime
+
+logger = logging.getLogger(f"chat_app.{__name__}")
+
+USAGE_FILENAME = "usage_ledger.csv"
+
+USAGE_FIELDNAMES = [
+    "timestamp",
+    "conversation_id",
+    "condition",
+    "invitation_code",
+    "user_id",
+    "bot",
+    "model",
+    "outcome",
+    "retries",
+    "latency_ms",
+    "prompt_tokens",
+    "completion_tokens",
+    "reasoning_tokens",
+    "total_tokens"
+]
+
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "0") or 0)
+BUDGET_FALLBACK_MODEL = os.getenv("BUDGET_FALLBACK_MODEL", "")
+
+
+def usage_tokens(response):
+    """Token counts from a completion response; None values where the provider gave none."""
+    tokens = {"prompt_tokens": None, "completion_tokens": None, "reasoning_tokens": None, "total_tokens": None}
+    usage = getattr(response, "usage", None) if response is not None else None
+    if not usage:
+        return tokens
+    tokens["prompt_tokens"] = usage.prompt_tokens
+    tokens["completion_tokens"] = usage.completion_tokens
+    tokens["total_tokens"] = usage.total_tokens
+    details = getattr(usage, "completion_tokens_details", None)
+    if details is not None and hasattr(details, "reasoning_tokens"):
+        tokens["reasoning_tokens"] = details.reasoning_tokens
+    return tokens
+
+
+def usage_row(context, bot, model, outcome, retries, latency_seconds, response):
+    """Build a ledger row; context holds conversation_id, condition, invitation_code and user_id."""
+    row = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "bot": bot,
+        "model": model,
+        "outcome": outcome,
+        "retries": retries,
+        "latency_ms": round(latency_seconds * 1000),
+        **context,
+    }
+    row.update(usage_tokens(response))
+    return row
+
+
+def record_usage(store, row):
+    """Append a ledger row. Accounting must never break a chat turn, so errors are only logged."""
+    try:
+        store.append_usage_row(row)
+    except Exception:
+        logger.exception("Failed to record LLM usage")
+
+
+def over_budget(tokens_used):
+    return SESSION_TOKEN_BUDGET > 0 and tokens_used >= SESSION_TOKEN_BUDGET
+
+
+def load_ledger(ledger=None, state_db=None):
+    import pandas as pd
+
+    if state_db:
+        conn = sqlite3.connect(f"file:{state_db}?mode=ro", uri=True)
+        try:
+            df = pd.read_sql_query("SELECT * FROM usage", conn)
+        finally:
+            conn.close()
+    else:
+        df = pd.read_csv(ledger or os.path.join("conversations", USAGE_FILENAME))
+    for column in ["retries", "latency_ms", "prompt_tokens", "completion_tokens", "reasoning_tokens", "total_tokens"]:
+        df[column] = pd.to_numeric(df[column], errors="coerce")
+    return df
+
+
+def summarize(df, by):
+    grouped = df.groupby(by)
+    summary = grouped.agg(
+        calls=("model", "size"),
+        sessions=("conversation_id", "nunique"),
+        prompt_tokens=("prompt_tokens", "sum"),
+        completion_tokens=("completion_tokens", "sum"),
+        total_tokens=("total_tokens", "sum"),
+        retries=("retries", "sum"),
+    )
+    summary["tokens_per_session"] = (summary["total_tokens"] / summary["sessions"]).round(1)
+    summary["failed_or_fallback"] = grouped["outcome"].apply(lambda s: int((s != "ok").sum()))
+    for column, label in [("latency_ms", "latency"), ("total_tokens", "tokens")]:
+        quantiles = grouped[column].quantile([0.5, 0.95]).unstack()
+        summary[f"{label}_p50"] = quantiles[0.5]
+        summary[f"{label}_p95"] = quantiles[0.95]
+    return summary
+
+
+def main():
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Summarize LLM token usage per condition and bot.")
+    parser.add_argument("--ledger", help=f"CSV ledger (default conversations/{USAGE_FILENAME})")
+    parser.add_argument("--state-db", help="SQLite state store to read the usage table from")
+    args = parser.parse_args()
+
+    df = load_ledger(args.ledger, args.state_db)
+    if df.empty:
+        print("No usage recorded yet.")
+        return
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print("Per condition:")
+        print(summarize(df, "condition"))
+        print()
+        print("Per bot:")
+        print(summarize(df, ["condition", "bot"]))
+
+
+if __name__ == "__main__":
+    main()